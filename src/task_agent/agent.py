@@ -30,6 +30,31 @@ from .platform_utils import get_hint_platform_suffix, get_shell_tool_name
 if TYPE_CHECKING:
     from .session import SessionManager
 
+# 输出分隔线（模块级常量，避免每次拼接）
+_RULE_HEAVY = "━" * 50
+_RULE_DOUBLE = "═" * 50
+_RULE_EQ = "=" * 50
+
+# 操作标签检测
+_ACTION_TAG_PATTERN = re.compile(
+    r"<(ps_call|bash_call|builtin|create_agent|fork_agent|return)\b", re.IGNORECASE
+)
+_RETURN_TAG_PATTERN = re.compile(r"<return\b", re.IGNORECASE)
+
+# 系统提示词中的状态区块模板（每个 Agent 初始化时格式化一次）
+_TREE_INFO_TEMPLATE = """
+**当前状态：**
+- 当前工作目录: {workspace_dir}
+- Agent ID: {agent_id}
+- 当前深度: {depth}
+- 最大深度: {max_depth}
+- 已创建子Agent: {sub_agents_created}
+- 本地配额: {local_remaining}/{max_agents}（当前Agent还能创建 {local_remaining} 个子任务）
+- 全局配额: {global_used}/{global_total}（整个任务累计已使用 {global_used} 个子任务，总计 {global_total} 个）
+- 上下文使用: {context_used}/{context_total} tokens ({context_percent:.1f}%)
+- 剩余可用: {context_remaining} tokens
+"""
+
 
 class Action(Enum):
     """Agent执行后的动作"""
@@ -122,6 +147,7 @@ class SimpleAgent:
         self.agent_id = str(uuid.uuid4())[:8]
         self.depth = depth
         self.max_depth = max_depth
+        self._max_agents = max_depth * max_depth  # 单Agent子任务配额（max_depth²）
         self.agent_name = agent_name  # 当前 agent 名称
         self.workspace_dir = workspace_dir
         self.runtime_scene = (runtime_scene or "cli").strip().lower()
@@ -176,7 +202,7 @@ class SimpleAgent:
 
     def _init_system_prompt(self):
         """初始化系统提示词"""
-        max_agents = self.max_depth**2
+        max_agents = self._max_agents
         local_remaining = max_agents - self.total_sub_agents_created
 
         # 全局配额（累加计数）
@@ -189,18 +215,21 @@ class SimpleAgent:
         context_remaining = context_total - context_used
         context_percent = (context_used / context_total) * 100
 
-        tree_info = f"""
-**当前状态：**
-- 当前工作目录: {self.workspace_dir or os.getcwd()}
-- Agent ID: {self.agent_id}
-- 当前深度: {self.depth}
-- 最大深度: {self.max_depth}
-- 已创建子Agent: {self.total_sub_agents_created}
-- 本地配额: {local_remaining}/{max_agents}（当前Agent还能创建 {local_remaining} 个子任务）
-- 全局配额: {global_used}/{global_total}（整个任务累计已使用 {global_used} 个子任务，总计 {global_total} 个）
-- 上下文使用: {context_used}/{context_total} tokens ({context_percent:.1f}%)
-- 剩余可用: {context_remaining} tokens
-"""
+        tree_info = _TREE_INFO_TEMPLATE.format(
+            workspace_dir=self.workspace_dir or os.getcwd(),
+            agent_id=self.agent_id,
+            depth=self.depth,
+            max_depth=self.max_depth,
+            sub_agents_created=self.total_sub_agents_created,
+            local_remaining=local_remaining,
+            max_agents=max_agents,
+            global_used=global_used,
+            global_total=global_total,
+            context_used=context_used,
+            context_total=context_total,
+            context_percent=context_percent,
+            context_remaining=context_remaining,
+        )
 
         predefined_agents = self._load_predefined_agent_metadata()
         predefined_section = self._format_predefined_agent_section(predefined_agents)
@@ -904,10 +933,9 @@ class SimpleAgent:
         # 格式化输出（保持向后兼容）
         outputs = []
         if reasoning and reasoning.strip():
-            outputs.append("\n** 思考过程：\n")
-            outputs.append(f"{'━' * 50}\n")
-            outputs.append(f"{reasoning}\n")
-            outputs.append(f"{'━' * 50}\n\n")
+            outputs.append(
+                f"\n** 思考过程：\n{_RULE_HEAVY}\n{reasoning}\n{_RULE_HEAVY}\n\n"
+            )
         if response and response.strip() and not has_tool_tags:
             outputs.append(response)
 
@@ -945,9 +973,11 @@ class SimpleAgent:
             if self.depth >= self.max_depth:
                 self._add_message("system", f"[深度限制] 请直接执行任务: {task}")
                 self._output_handler.on_depth_limit()
-                outputs.append("\n!! [深度限制]\n")
-                outputs.append(f"已达到最大深度 {self.max_depth}，由当前Agent执行\n")
-                outputs.append(f"{'═' * 50}\n\n")
+                outputs.append(
+                    f"\n!! [深度限制]\n"
+                    f"已达到最大深度 {self.max_depth}，由当前Agent执行\n"
+                    f"{_RULE_DOUBLE}\n\n"
+                )
                 return StepResult(
                     outputs=self._add_depth_prefix(outputs),
                     action=Action.CONTINUE,
@@ -956,11 +986,13 @@ class SimpleAgent:
                 )
 
             # 检查本地配额限制
-            if self.total_sub_agents_created >= self.max_depth**2:
+            if self.total_sub_agents_created >= self._max_agents:
                 self._output_handler.on_quota_limit("local")
-                outputs.append("\n!! [本地配额限制]\n")
-                outputs.append(f"当前Agent已用完 {self.max_depth**2} 个子Agent配额\n")
-                outputs.append(f"{'═' * 50}\n\n")
+                outputs.append(
+                    f"\n!! [本地配额限制]\n"
+                    f"当前Agent已用完 {self._max_agents} 个子Agent配额\n"
+                    f"{_RULE_DOUBLE}\n\n"
+                )
                 self._add_message("system", f"[本地配额限制] 请直接执行任务: {task}")
                 return StepResult(
                     outputs=self._add_depth_prefix(outputs),
@@ -970,12 +1002,14 @@ class SimpleAgent:
                 )
 
             # 检查全局配额限制（防止层级间循环）- 累加计数
-            global_total = self.max_depth**2 * 2
+            global_total = self._max_agents * 2
             if self._global_subagent_count >= global_total:
                 self._output_handler.on_quota_limit("global")
-                outputs.append("\n!! [全局配额限制]\n")
-                outputs.append(f"整个任务已用完所有 {global_total} 个子Agent配额\n")
-                outputs.append(f"{'═' * 50}\n\n")
+                outputs.append(
+                    f"\n!! [全局配额限制]\n"
+                    f"整个任务已用完所有 {global_total} 个子Agent配额\n"
+                    f"{_RULE_DOUBLE}\n\n"
+                )
                 self._add_message("system", f"[全局配额限制] 请直接执行任务: {task}")
                 return StepResult(
                     outputs=self._add_depth_prefix(outputs),
@@ -1026,8 +1060,8 @@ class SimpleAgent:
         # 只有当没有任何标签时才等待（reasoning 不影响）
         if not self._has_action_tags(response) and not tool_outputs:
             self._output_handler.on_wait_input()
-            outputs.append("\n?? 等待用户输入...\n")
-            outputs.append("[等待用户输入]\n")  # 保留供 cli.py 检测
+            # "[等待用户输入]" 标记保留供 cli.py 检测
+            outputs.append("\n?? 等待用户输入...\n[等待用户输入]\n")
             return StepResult(
                 outputs=self._add_depth_prefix(outputs),
                 action=Action.WAIT,
@@ -1297,17 +1331,16 @@ class SimpleAgent:
 
     def _has_action_tags(self, response: str) -> bool:
         """检查是否有操作标签"""
-        return bool(
-            re.search(
-                r"<(ps_call|bash_call|builtin|create_agent|fork_agent|return)\b",
-                response,
-                re.IGNORECASE,
-            )
-        )
+        # 普通对话通常不含标签，先用子串判断跳过正则
+        if "<" not in response:
+            return False
+        return bool(_ACTION_TAG_PATTERN.search(response))
 
     def _is_completed(self, response: str) -> bool:
         """检查是否完成"""
-        return bool(re.search(r"<return\b", response, re.IGNORECASE))
+        if "<" not in response:
+            return False
+        return bool(_RETURN_TAG_PATTERN.search(response))
 
     def _extract_return(self, response: str) -> str:
         """提取返回内容"""
@@ -1410,7 +1443,7 @@ class SimpleAgent:
 
             # 调用回调
             # 命令框单独存储，不放入 outputs
-            block = f"\n>> [待执行命令 #{self.total_commands_executed}]\n命令: {display_command}\n{'━' * 50}\n\n"
+            block = f"\n>> [待执行命令 #{self.total_commands_executed}]\n命令: {display_command}\n{_RULE_HEAVY}\n\n"
             # 添加深度前缀到命令框
             prefix = "+" * self.depth + " " if self.depth > 0 else ""
             if prefix:
@@ -1508,7 +1541,7 @@ class SimpleAgent:
 
             # 命令框单独存储，不放入 outputs（兼容 CLI）
             depth_prefix = "+" * self.depth + " " if self.depth > 0 else ""
-            block = f"\n>> [待执行命令 #{self.total_commands_executed}]\n命令: {display_command}\n{'━' * 50}\n\n"
+            block = f"\n>> [待执行命令 #{self.total_commands_executed}]\n命令: {display_command}\n{_RULE_HEAVY}\n\n"
             if depth_prefix:
                 lines = block.split("\n")
                 prefixed_lines = [
@@ -1630,7 +1663,7 @@ class Executor:
         self.runtime_scene = (runtime_scene or "cli").strip().lower()
 
         # 全局子Agent配额（防止层级间循环）- 累加计数
-        self._global_subagent_total = max_depth**2 * 2  # 总配额
+        self._global_subagent_total = max_depth * max_depth * 2  # 总配额
         self._global_subagent_count = 0  # 已使用的子Agent数量
 
         # 保存最近的 StepResult，供 cli.py 访问
@@ -2061,16 +2094,11 @@ class Executor:
                     self.current_agent = parent
                 else:
                     # 根 agent 完成后，保留 current_agent 状态，等待下一个任务
-                    final_outputs = [
-                        f"\n{'=' * 50}\n",
-                        f"[任务完成]\n",
-                        f"{'=' * 50}\n",
-                        f"{result.data}\n",
-                    ]
                     agent_summary = self.current_agent.get_summary()
-                    final_outputs.append(
+                    final_outputs = [
+                        f"\n{_RULE_EQ}\n[任务完成]\n{_RULE_EQ}\n{result.data}\n"
                         f"执行命令: {agent_summary['commands']} | 创建子Agent: {agent_summary['sub_agents']}\n\n"
-                    )
+                    ]
                     yield (final_outputs, result)
                     self._is_running = False
                     # 不 break，保留 current_agent 供下一个任务使用
@@ -3,16 +3,27 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from typing import Callable, Optional
 import json
+import os
 import re
 
 
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+# Shared JSON decoder (orjson when available); other modules import it from here.
+json_loads = orjson.loads if orjson is not None else json.loads
+
 ValueNormalizer = Callable[[str], str]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BuiltinPathPolicy:
     """Path field policy."""
 
@@ -20,7 +31,7 @@ class BuiltinPathPolicy:
     allow_absolute: bool = True
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BuiltinFieldSpec:
     """builtin argument definition."""
 
@@ -32,8 +43,13 @@ class BuiltinFieldSpec:
     aliases: tuple[str, ...] = ()
     normalizer: Optional[ValueNormalizer] = None
 
+    def __post_init__(self) -> None:
+        # Store aliases in lookup form so parsing never re-normalizes them.
+        aliases = tuple(alias.strip().lower() for alias in self.aliases if alias.strip())
+        object.__setattr__(self, "aliases", aliases)
+
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BuiltinToolSpec:
     """builtin tool definition."""
 
@@ -42,7 +58,7 @@ class BuiltinToolSpec:
     allow_unknown_fields: bool = False
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BuiltinParseError:
     """Normalized parse error for builtin commands."""
 
@@ -50,8 +66,8 @@ class BuiltinParseError:
     detail: str = ""
 
 
-def _lower_bool(value: str) -> str:
-    return str(value).strip().lower()
+# Normalizers receive already-stripped text, so the C-level str.lower is enough.
+_lower_bool: ValueNormalizer = str.lower
 
 
 READ_FILE_SPEC = BuiltinToolSpec(
@@ -151,42 +167,62 @@ BUILTIN_TOOL_SCHEMAS: dict[str, BuiltinToolSpec] = {
 }
 
 
+_SchemaIndex = tuple[
+    dict[str, BuiltinFieldSpec],
+    dict[str, str],
+    tuple[BuiltinFieldSpec, ...],
+    tuple[BuiltinFieldSpec, ...],
+]
+
+
+def _build_schema_index(schema: BuiltinToolSpec) -> _SchemaIndex:
+    """Return (fields_by_name, alias_to_canonical, default_fields, required_fields)."""
+    fields = {field.name: field for field in schema.fields}
+    alias_map = {alias: field.name for field in schema.fields for alias in field.aliases}
+    defaults = tuple(field for field in schema.fields if field.default is not None)
+    required = tuple(field for field in schema.fields if field.required)
+    return fields, alias_map, defaults, required
+
+
+# Specs are immutable, so lookup tables are built once at import.
+_SCHEMA_INDEX: dict[str, _SchemaIndex] = {
+    name: _build_schema_index(schema) for name, schema in BUILTIN_TOOL_SCHEMAS.items()
+}
+
+
 def get_builtin_tool_schema(tool_name: str) -> Optional[BuiltinToolSpec]:
+    # Callers usually pass the canonical name already; try it before normalizing.
+    schema = BUILTIN_TOOL_SCHEMAS.get(tool_name) if tool_name else None
+    if schema is not None:
+        return schema
     return BUILTIN_TOOL_SCHEMAS.get((tool_name or "").strip().lower())
 
 
+def _first_line(text: str) -> str:
+    """Return text.splitlines()[0] (or "") without splitting the whole text."""
+    head = text.partition("\n")[0]
+    # splitlines() also breaks on \r and other separators; apply it to the head only.
+    lines = head.splitlines()
+    return lines[0] if lines else ""
+
+
 def parse_builtin_tool_name(command_text: str) -> str:
-    lines = (command_text or "").splitlines()
-    if not lines:
-        return ""
-    first = lines[0].strip().lower()
+    first = _first_line(command_text or "").strip().lower()
     if first.startswith("builtin."):
         tail = first.split(".", 1)[1].strip()
         return tail.split(None, 1)[0].strip()
     return first.strip()
 
 
-def parse_builtin_simple_kv_args(command_text: str) -> dict[str, str]:
-    """Parse simplified key:value args and ignore block payload."""
-    args: dict[str, str] = {}
-    inline_match = re.match(r"^\s*builtin\.(\w+)\s*(\{[\s\S]*\})\s*$", (command_text or "").strip())
-    if inline_match:
-        json_text = inline_match.group(2)
-        try:
-            parsed = json.loads(json_text)
-            if isinstance(parsed, dict):
-                for key, value in parsed.items():
-                    args[str(key).strip().lower()] = str(value).strip()
-                return args
-        except Exception:
-            pass
-
-    lines = (command_text or "").splitlines()
-    if len(lines) <= 1:
-        return args
+def _scan_kv_lines(command_text: str) -> tuple[dict[str, str], Optional[str]]:
+    """Parse key:value lines and report the first invalid line in one walk.
 
+    Lines after the header are scanned once; `<<<`/`>>>` block content is skipped.
+    """
+    args: dict[str, str] = {}
+    invalid_line: Optional[str] = None
     in_block = False
-    for raw_line in lines[1:]:
+    for raw_line in islice(command_text.splitlines(), 1, None):
         line = raw_line.strip()
         if not line:
             continue
@@ -198,37 +234,55 @@ def parse_builtin_simple_kv_args(command_text: str) -> dict[str, str]:
             continue
         if in_block:
             continue
-        if ":" not in line:
+        key, sep, value = line.partition(":")
+        if not sep:
+            if invalid_line is None:
+                invalid_line = raw_line
             continue
-        key, value = line.split(":", 1)
         key = key.strip().lower()
         value = value.strip()
-        if len(value) >= 2 and value[0] == value[-1] and value[0] in {'"', "'"}:
+        if len(value) >= 2 and value[0] in ('"', "'") and value[-1] == value[0]:
             value = value[1:-1]
         args[key] = value
-    return args
+    return args, invalid_line
+
+
+_INLINE_JSON_RE = re.compile(r"^\s*builtin\.(\w+)\s*(\{[\s\S]*\})\s*$")
 
 
-def _find_invalid_kv_line(command_text: str) -> Optional[str]:
-    lines = (command_text or "").splitlines()
-    if len(lines) <= 1:
+def _parse_inline_json_args(text: str) -> Optional[dict[str, str]]:
+    """Parse `builtin.<tool> {...}`; `text` must already be stripped."""
+    # The multi-line key:value form is the common case; skip regex/JSON for it.
+    if not text.startswith("builtin.") or not text.endswith("}") or "{" not in text:
         return None
-    in_block = False
-    for raw_line in lines[1:]:
-        line = raw_line.strip()
-        if not line:
-            continue
-        if line == "<<<":
-            in_block = True
-            continue
-        if line == ">>>":
-            in_block = False
-            continue
-        if in_block:
-            continue
-        if ":" not in line:
-            return raw_line
-    return None
+    inline_match = _INLINE_JSON_RE.match(text)
+    if not inline_match:
+        return None
+    json_text = inline_match.group(2)
+    try:
+        parsed = json_loads(json_text)
+    except Exception:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    return {str(key).strip().lower(): str(value).strip() for key, value in parsed.items()}
+
+
+def _parse_simple_kv_args_with_invalid(command_text: str) -> tuple[dict[str, str], Optional[str]]:
+    text = command_text or ""
+    inline_args = _parse_inline_json_args(text.strip())
+    if inline_args is not None:
+        return inline_args, _scan_kv_lines(text)[1]
+    return _scan_kv_lines(text)
+
+
+def parse_builtin_simple_kv_args(command_text: str) -> dict[str, str]:
+    """Parse simplified key:value args and ignore block payload."""
+    text = command_text or ""
+    inline_args = _parse_inline_json_args(text.strip())
+    if inline_args is not None:
+        return inline_args
+    return _scan_kv_lines(text)[0]
 
 
 def normalize_builtin_args_with_schema(
@@ -237,22 +291,25 @@ def normalize_builtin_args_with_schema(
     *,
     reject_unknown_fields: bool = True,
     enforce_required: bool = True,
+    keys_normalized: bool = False,
 ) -> tuple[dict[str, str], Optional[BuiltinParseError]]:
+    """Map raw args onto the tool schema.
+
+    Pass keys_normalized=True when keys are already stripped and lowercased
+    (as produced by the builtin key:value parsers) to skip re-normalizing them.
+    """
     schema = get_builtin_tool_schema(tool_name)
     if not schema:
         return dict(raw_args), None
 
-    fields = {field.name: field for field in schema.fields}
-    alias_map = {
-        alias.strip().lower(): field.name
-        for field in schema.fields
-        for alias in field.aliases
-        if alias.strip()
-    }
+    index = _SCHEMA_INDEX.get(schema.tool_name)
+    if index is None:
+        index = _build_schema_index(schema)
+    fields, alias_map, default_fields, required_fields = index
 
     args: dict[str, str] = {}
     for key, value in raw_args.items():
-        raw_key = str(key).strip().lower()
+        raw_key = key if keys_normalized else str(key).strip().lower()
         canonical = alias_map.get(raw_key, raw_key)
         field_spec = fields.get(canonical)
         if field_spec is None:
@@ -267,21 +324,23 @@ def normalize_builtin_args_with_schema(
             text = field_spec.normalizer(text)
         args[field_spec.name] = text
 
-    for field in schema.fields:
-        if field.name not in args and field.default is not None:
+    for field in default_fields:
+        if field.name not in args:
             args[field.name] = str(field.default)
 
     if enforce_required:
-        for field in schema.fields:
-            if not field.required:
-                continue
-            value = str(args.get(field.name, "")).strip()
-            if not value:
+        # Values in args are already stripped and non-empty (see the loop above).
+        for field in required_fields:
+            if not args.get(field.name):
                 return {}, BuiltinParseError(kind="required", detail=field.name)
 
     return args, None
 
 
+# Commands above this size are parsed without memoization to bound memory.
+_PARSE_CACHE_MAX_TEXT = 64 * 1024
+
+
 def parse_builtin_args_by_schema(
     command_text: str,
     tool_name: str,
@@ -293,52 +352,92 @@ def parse_builtin_args_by_schema(
     if not text:
         return {}, BuiltinParseError(kind="empty_command")
 
-    first_line = text.splitlines()[0].strip().lower()
+    if len(text) > _PARSE_CACHE_MAX_TEXT:
+        return _parse_args_by_schema(
+            text, tool_name, allow_invalid_kv_lines, reject_unknown_fields
+        )
+    args, error = _parse_command_cached(
+        text, tool_name, allow_invalid_kv_lines, reject_unknown_fields
+    )
+    # Cached dicts are shared; hand callers their own copy.
+    return dict(args), error
+
+
+@lru_cache(maxsize=256)
+def _parse_command_cached(
+    text: str,
+    tool_name: str,
+    allow_invalid_kv_lines: bool,
+    reject_unknown_fields: bool,
+) -> tuple[dict[str, str], Optional[BuiltinParseError]]:
+    return _parse_args_by_schema(
+        text, tool_name, allow_invalid_kv_lines, reject_unknown_fields
+    )
+
+
+def _parse_args_by_schema(
+    text: str,
+    tool_name: str,
+    allow_invalid_kv_lines: bool,
+    reject_unknown_fields: bool,
+) -> tuple[dict[str, str], Optional[BuiltinParseError]]:
+
+    first_line = _first_line(text).strip().lower()
     expected = f"builtin.{tool_name}"
     if not first_line.startswith(expected):
         return {}, BuiltinParseError(kind="invalid_format")
 
-    if not allow_invalid_kv_lines:
-        invalid_line = _find_invalid_kv_line(text)
-        if invalid_line is not None:
-            return {}, BuiltinParseError(kind="invalid_line", detail=invalid_line)
+    raw_args, invalid_line = _parse_simple_kv_args_with_invalid(text)
+    if invalid_line is not None and not allow_invalid_kv_lines:
+        return {}, BuiltinParseError(kind="invalid_line", detail=invalid_line)
 
-    raw_args = parse_builtin_simple_kv_args(text)
     return normalize_builtin_args_with_schema(
         tool_name,
         raw_args,
         reject_unknown_fields=reject_unknown_fields,
+        keys_normalized=True,
     )
 
 
 def _is_subpath(path: Path, root: Path) -> bool:
-    try:
-        path.relative_to(root)
-        return True
-    except ValueError:
+    # Prefix compare on parts; relative_to() would raise on the common "outside" case.
+    root_parts = root.parts
+    path_parts = path.parts[: len(root_parts)]
+    if len(path_parts) != len(root_parts):
         return False
+    if path_parts == root_parts:
+        return True
+    # Windows paths compare case-insensitively, as PureWindowsPath does.
+    return os.name == "nt" and [os.path.normcase(part) for part in path_parts] == [
+        os.path.normcase(part) for part in root_parts
+    ]
 
 
-def resolve_path_against_workspace(path_text: str, workspace_dir: str) -> tuple[Optional[Path], Optional[str]]:
+def resolve_path_against_workspace(
+    path_text: str,
+    workspace_dir: str,
+    *,
+    workspace_path: Optional[Path] = None,
+) -> tuple[Optional[Path], Optional[str]]:
     raw = (path_text or "").strip()
     if not raw:
         return None, "路径参数不能为空"
 
-    path_obj = Path(raw)
     workspace = (workspace_dir or "").strip()
 
-    if path_obj.is_absolute():
-        return path_obj.resolve(), None
+    # Work on strings with os.path and only build a Path for the result.
+    if Path(raw).is_absolute():
+        return Path(os.path.realpath(raw)), None
 
-    if not workspace:
-        return None, "workspace_dir 未设置，无法解析相对路径"
-
-    try:
-        workspace_path = Path(workspace).resolve()
-    except Exception as exc:
-        return None, f"workspace_dir 无效: {exc}"
+    if workspace_path is None:
+        if not workspace:
+            return None, "workspace_dir 未设置，无法解析相对路径"
+        try:
+            workspace_path = Path(os.path.realpath(workspace))
+        except Exception as exc:
+            return None, f"workspace_dir 无效: {exc}"
 
-    return (workspace_path / path_obj).resolve(), None
+    return Path(os.path.realpath(os.path.join(workspace_path, raw))), None
 
 
 def builtin_requires_authorization(command_text: str, workspace_dir: str) -> bool:
@@ -361,7 +460,7 @@ def builtin_requires_authorization(command_text: str, workspace_dir: str) -> boo
         return True
 
     try:
-        workspace_path = Path(workspace).resolve()
+        workspace_path = Path(os.path.realpath(workspace))
     except Exception:
         return True
 
@@ -371,7 +470,10 @@ def builtin_requires_authorization(command_text: str, workspace_dir: str) -> boo
         value = args.get(field.name)
         if not value:
             continue
-        resolved, error = resolve_path_against_workspace(value, workspace)
+        # Reuse the workspace resolved above instead of resolving it per field.
+        resolved, error = resolve_path_against_workspace(
+            value, workspace, workspace_path=workspace_path
+        )
         if error or resolved is None:
             return True
         if Path(value).is_absolute() and not _is_subpath(resolved, workspace_path):
@@ -380,7 +482,7 @@ def builtin_requires_authorization(command_text: str, workspace_dir: str) -> boo
     return False
 
 
-def build_builtin_read_file_example_lines() -> list[str]:
+def _build_read_file_example_lines() -> list[str]:
     spec = READ_FILE_SPEC
     defaults = {field.name: field.default for field in spec.fields}
     return [
@@ -393,7 +495,7 @@ def build_builtin_read_file_example_lines() -> list[str]:
     ]
 
 
-def build_builtin_smart_edit_example_lines() -> list[str]:
+def _build_smart_edit_example_lines() -> list[str]:
     spec = SMART_EDIT_SPEC
     defaults = {field.name: field.default for field in spec.fields}
     return [
@@ -411,3 +513,16 @@ def build_builtin_smart_edit_example_lines() -> list[str]:
         ">>>",
         "</builtin>",
     ]
+
+
+# Specs are frozen, so the example blocks are rendered once at import.
+_READ_FILE_EXAMPLE_LINES: tuple[str, ...] = tuple(_build_read_file_example_lines())
+_SMART_EDIT_EXAMPLE_LINES: tuple[str, ...] = tuple(_build_smart_edit_example_lines())
+
+
+def build_builtin_read_file_example_lines() -> list[str]:
+    return list(_READ_FILE_EXAMPLE_LINES)
+
+
+def build_builtin_smart_edit_example_lines() -> list[str]:
+    return list(_SMART_EDIT_EXAMPLE_LINES)
@@ -2,17 +2,24 @@
 
 import argparse
 import atexit
+import base64
+import codecs
 import json
 import os
 import re
 import shlex
+import shutil
+import stat
 import subprocess
 import sys
 import tempfile
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from typing import Optional
 
@@ -22,9 +29,10 @@ from rich.panel import Panel
 from rich.text import Text
 from rich.theme import Theme
 
-from .agent import Executor
+from .agent import Action, Executor
 from .builtin_schema import (
     BuiltinParseError,
+    json_loads,
     normalize_builtin_args_with_schema,
     parse_builtin_args_by_schema,
     parse_builtin_simple_kv_args,
@@ -76,12 +84,94 @@ def _clear_input_buffer():
             msvcrt.getch()
 
 
+def _get_console_escape_poller():
+    """返回等待并读取控制台输入事件、判断是否按下 Esc 的函数（仅 Windows 控制台），不可用时返回 None。"""
+    if msvcrt is None:
+        return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class _KeyEventRecord(ctypes.Structure):
+            _fields_ = [
+                ("bKeyDown", wintypes.BOOL),
+                ("wRepeatCount", wintypes.WORD),
+                ("wVirtualKeyCode", wintypes.WORD),
+                ("wVirtualScanCode", wintypes.WORD),
+                ("uChar", wintypes.WCHAR),
+                ("dwControlKeyState", wintypes.DWORD),
+            ]
+
+        class _EventUnion(ctypes.Union):
+            # 各类事件记录中最大的为 16 字节
+            _fields_ = [("KeyEvent", _KeyEventRecord), ("_raw", ctypes.c_byte * 16)]
+
+        class _InputRecord(ctypes.Structure):
+            _fields_ = [("EventType", wintypes.WORD), ("Event", _EventUnion)]
+
+        # 独立的 WinDLL 实例，设置 argtypes/restype 不影响全局 windll
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.GetStdHandle.argtypes = [wintypes.DWORD]
+        kernel32.GetStdHandle.restype = wintypes.HANDLE
+        kernel32.GetConsoleMode.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+        kernel32.GetConsoleMode.restype = wintypes.BOOL
+        kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        for name in ("PeekConsoleInputW", "ReadConsoleInputW"):
+            func = getattr(kernel32, name)
+            func.argtypes = [
+                wintypes.HANDLE,
+                ctypes.POINTER(_InputRecord),
+                wintypes.DWORD,
+                ctypes.POINTER(wintypes.DWORD),
+            ]
+            func.restype = wintypes.BOOL
+        handle = kernel32.GetStdHandle(-10 & 0xFFFFFFFF)  # STD_INPUT_HANDLE = (DWORD)-10
+        mode = wintypes.DWORD()
+        if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            return None  # stdin 被重定向，不是控制台
+    except Exception:
+        return None
+
+    key_event = 0x0001  # KEY_EVENT
+    vk_escape = 0x1B
+    records = (_InputRecord * 32)()
+
+    def poll(timeout_ms: int) -> bool:
+        if kernel32.WaitForSingleObject(handle, timeout_ms) != 0:  # WAIT_OBJECT_0
+            return False
+        # 先 Peek 出已就绪的事件数，再读取同样数量，保证 ReadConsoleInputW 不会阻塞；
+        # 鼠标/焦点/窗口大小等事件一并被读走，否则句柄会一直处于有信号状态
+        available = wintypes.DWORD()
+        if not kernel32.PeekConsoleInputW(
+            handle, records, len(records), ctypes.byref(available)
+        ):
+            return False
+        if not available.value:
+            return False
+        read = wintypes.DWORD()
+        if not kernel32.ReadConsoleInputW(
+            handle, records, available.value, ctypes.byref(read)
+        ):
+            return False
+        for record in records[: read.value]:
+            if record.EventType != key_event:
+                continue
+            key = record.Event.KeyEvent
+            if key.bKeyDown and key.wVirtualKeyCode == vk_escape:
+                return True
+        return False
+
+    return poll
+
+
 def _start_esc_skip_listener(executor: Executor, console: Console):
     """仅在执行阶段监听 Esc，触发跳过下一次解析。"""
     if msvcrt is None:
         return None
 
     stop_event = threading.Event()
+    poll_escape = _get_console_escape_poller()
 
     def _run():
         while not stop_event.is_set():
@@ -89,11 +179,16 @@ def _start_esc_skip_listener(executor: Executor, console: Console):
                 if executor.is_waiting_for_input():
                     time.sleep(0.05)
                     continue
-                if not msvcrt.kbhit():
-                    time.sleep(0.05)
-                    continue
-                key = msvcrt.getch()
-                if key == b"\x1b":
+                if poll_escape is not None:
+                    # 控制台可用时阻塞等待输入事件，代替固定间隔轮询
+                    pressed = poll_escape(100)
+                else:
+                    # stdin 被重定向时退回 kbhit 轮询
+                    if not msvcrt.kbhit():
+                        time.sleep(0.05)
+                        continue
+                    pressed = msvcrt.getch() == b"\x1b"
+                if pressed:
                     executor.arm_skip_next_parse("cli_esc")
                     console.print("[info]stop已生效：将跳过下一次解析[/info]")
             except Exception:
@@ -112,6 +207,56 @@ def _stop_esc_skip_listener(listener) -> None:
     thread.join(timeout=0.2)
 
 
+# 匹配 @filename 格式（@ 后跟非空白字符）
+_FILE_REF_PATTERN = re.compile(r"@(\S+)")
+# @ 引用文件的大小上限，避免误引用大文件拖垮交互进程
+_MAX_FILE_REF_BYTES = 1 << 20
+
+
+def _read_file_reference(file_path: str) -> tuple[Optional[str], Optional[str]]:
+    """读取单个 @ 引用文件，返回 (文件内容, 错误信息)；内容为 None 时保留原 @path。"""
+    # 一次 stat 同时判断存在性与类型
+    try:
+        st = os.stat(file_path)
+    except (OSError, ValueError):
+        return None, None  # 非文件路径，保持原样
+    # 检查是否为目录
+    if stat.S_ISDIR(st.st_mode):
+        return None, f"[warning]路径是目录而非文件: @{file_path}[/warning]"
+    try:
+        # 二进制有界读取，跳过文本层解码循环
+        with open(file_path, "rb") as f:
+            data = f.read(_MAX_FILE_REF_BYTES + 1)
+        truncated = len(data) > _MAX_FILE_REF_BYTES
+        if truncated:
+            # 只保留前 1 MiB；增量解码器丢弃被截断的半个多字节字符
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            content = decoder.decode(data[:_MAX_FILE_REF_BYTES], final=False)
+        else:
+            # 与文本模式一致：严格 UTF-8 解码
+            content = data.decode("utf-8")
+        # 统一换行
+        if "\r" in content:
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        if truncated:
+            limit_kb = _MAX_FILE_REF_BYTES // 1024
+            content += f"\n...[文件超过 {limit_kb} KB，已截断]"
+            return content, (
+                f"[warning]文件过大（超过 {limit_kb} KB），已截断: @{file_path}[/warning]"
+            )
+        # 只返回文件内容，不包含文件名
+        return content, None
+    except FileNotFoundError:
+        return None, f"[warning]文件不存在: @{file_path}[/warning]"
+    except PermissionError:
+        return None, f"[warning]无权限访问: @{file_path}[/warning]"
+    except Exception as e:
+        return None, f"[error]读取文件 @{file_path} 失败: {e}[/error]"
+
+
+_FILE_REF_READ_WORKERS = 4
+
+
 def _resolve_file_references(text: str) -> tuple[str, list[str]]:
     """解析输入中的 @ 文件引用，返回替换后的文本和错误列表
 
@@ -121,35 +266,36 @@ def _resolve_file_references(text: str) -> tuple[str, list[str]]:
     Returns:
         (替换后的文本, 错误列表)
     """
-    errors = []
-    # 匹配 @filename 格式（@ 后跟非空白字符）
-    pattern = r"@(\S+)"
-
-    def replace_match(match):
-        file_path = match.group(1)
-        if not os.path.exists(file_path):
-            return match.group(0)  # 非文件路径，保持原样
-        # 检查是否为目录
-        if os.path.isdir(file_path):
-            errors.append(f"[warning]路径是目录而非文件: @{file_path}[/warning]")
-            return match.group(0)  # 保留原 @path
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            # 只返回文件内容，不包含文件名
-            return content
-        except FileNotFoundError:
-            errors.append(f"[warning]文件不存在: @{file_path}[/warning]")
-            return match.group(0)  # 保留原 @path
-        except PermissionError:
-            errors.append(f"[warning]无权限访问: @{file_path}[/warning]")
-            return match.group(0)  # 保留原 @path
-        except Exception as e:
-            errors.append(f"[error]读取文件 @{file_path} 失败: {e}[/error]")
-            return match.group(0)  # 保留原 @path
+    # 绝大多数输入没有 @ 引用，直接返回
+    if "@" not in text:
+        return text, []
+
+    matches = list(_FILE_REF_PATTERN.finditer(text))
+    if not matches:
+        return text, []
+
+    # 同一路径只读一次；多个文件时并发读取，重叠磁盘等待
+    paths = list(dict.fromkeys(match.group(1) for match in matches))
+    if len(paths) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(_FILE_REF_READ_WORKERS, len(paths))
+        ) as pool:
+            loaded = dict(zip(paths, pool.map(_read_file_reference, paths)))
+    else:
+        loaded = {paths[0]: _read_file_reference(paths[0])}
 
-    result = re.sub(pattern, replace_match, text)
-    return result, errors
+    errors = []
+    parts = []
+    last_end = 0
+    for match in matches:
+        content, error = loaded[match.group(1)]
+        if error:
+            errors.append(error)
+        parts.append(text[last_end : match.start()])
+        parts.append(match.group(0) if content is None else content)
+        last_end = match.end()
+    parts.append(text[last_end:])
+    return "".join(parts), errors
 
 
 console = Console(theme=custom_theme)
@@ -183,21 +329,18 @@ def _get_editor_command() -> list[str]:
             return shlex.split(editor)
         except ValueError:
             return [editor]
+    return list(_get_default_editor_command())
+
+
+@lru_cache(maxsize=1)
+def _get_default_editor_command() -> tuple[str, ...]:
+    """未设置 VISUAL/EDITOR 时的默认编辑器（进程内只探测一次）。"""
     if is_windows():
-        try:
-            result = subprocess.run(
-                ["where", "notepad++"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-                text=True,
-                check=False,
-            )
-            if result.stdout.strip():
-                return ["notepad++"]
-        except Exception:
-            pass
-        return ["notepad"]
-    return ["vim"]
+        # 进程内扫描 PATH，替代每次启动 `where notepad++` 子进程
+        if shutil.which("notepad++"):
+            return ("notepad++",)
+        return ("notepad",)
+    return ("vim",)
 
 
 def _open_external_editor(initial_text: str) -> Optional[str]:
@@ -208,7 +351,6 @@ def _open_external_editor(initial_text: str) -> Optional[str]:
             mode="w", delete=False, encoding="utf-8", suffix=".txt"
         )
         tmp_file.write(initial_text or "")
-        tmp_file.flush()
         tmp_file.close()
         if is_windows() and editor_cmd and "notepad++" in editor_cmd[0].lower():
             cmd = [
@@ -227,8 +369,7 @@ def _open_external_editor(initial_text: str) -> Optional[str]:
             subprocess.call(cmd)
         else:
             subprocess.call(editor_cmd + [tmp_file.name])
-        with open(tmp_file.name, "r", encoding="utf-8") as handle:
-            return handle.read()
+        return Path(tmp_file.name).read_text(encoding="utf-8")
     except Exception as exc:
         console.print(f"[error]打开外部编辑器失败: {exc}[/error]")
         return None
@@ -240,41 +381,82 @@ def _open_external_editor(initial_text: str) -> Optional[str]:
                 pass
 
 
+# 按起始目录缓存项目根，避免每个后台任务都逐级 stat
+_PROJECT_ROOT_CACHE: dict[str, Path] = {}
+
+
 def _find_project_root(start_dir: str) -> Path:
+    cached = _PROJECT_ROOT_CACHE.get(start_dir)
+    if cached is not None:
+        return cached
     current = Path(start_dir).resolve()
+    root = current
     for candidate in [current] + list(current.parents):
         if (candidate / "pyproject.toml").exists():
-            return candidate
-    return current
+            root = candidate
+            break
+    _PROJECT_ROOT_CACHE[start_dir] = root
+    return root
 
 
 def _get_ps_jobs_dir() -> Path:
-    root = _find_project_root(os.getcwd())
-    jobs_dir = root / ".ps_jobs"
+    jobs_dir = _find_project_root(os.getcwd()) / ".ps_jobs"
+    # 每次都确保目录存在：会话期间 .ps_jobs 可能被手动删除
     jobs_dir.mkdir(parents=True, exist_ok=True)
     return jobs_dir
 
 
+# 首个后台任务创建时才注册退出清理，从未启动后台任务的会话无需任何退出处理
+_CLEANUP_REGISTERED = False
+
+
 def _register_background_job(job_id: str, process, log_path: Path) -> None:
+    global _CLEANUP_REGISTERED
     _BACKGROUND_JOBS[job_id] = {
         "process": process,
         "log_path": log_path,
     }
+    if not _CLEANUP_REGISTERED:
+        atexit.register(_cleanup_background_jobs)
+        _CLEANUP_REGISTERED = True
 
 
-def _cleanup_background_jobs() -> None:
-    for job_id, info in list(_BACKGROUND_JOBS.items()):
+def _cleanup_background_jobs(timeout: float = 2.0) -> None:
+    if not _BACKGROUND_JOBS:
+        return
+    jobs = list(_BACKGROUND_JOBS.items())
+    # 先向所有仍在运行的进程发送 terminate，再统一等待，总耗时不随任务数线性增长
+    running = []
+    for _job_id, info in jobs:
         process = info.get("process")
-        log_path = info.get("log_path")
         try:
             if process and process.poll() is None:
                 process.terminate()
-                try:
-                    process.wait(timeout=2)
-                except Exception:
-                    process.kill()
+                running.append(process)
+        except Exception:
+            pass
+
+    deadline = time.monotonic() + timeout
+    while running and time.monotonic() < deadline:
+        still_running = []
+        for process in running:
+            try:
+                if process.poll() is None:
+                    still_running.append(process)
+            except Exception:
+                pass
+        running = still_running
+        if running:
+            time.sleep(0.02)
+
+    for process in running:
+        try:
+            process.kill()
         except Exception:
             pass
+
+    for job_id, info in jobs:
+        log_path = info.get("log_path")
         try:
             if log_path and log_path.exists():
                 log_path.unlink()
@@ -283,12 +465,15 @@ def _cleanup_background_jobs() -> None:
         _BACKGROUND_JOBS.pop(job_id, None)
 
 
-atexit.register(_cleanup_background_jobs)
+_TEMPLATE_DIR = os.path.join(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "templates"
+)
 
 
+@lru_cache(maxsize=32)
 def _load_template_text(filename: str) -> str:
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    template_path = os.path.join(project_root, "templates", filename)
+    """读取 templates 下的提示词模板（进程内缓存，模板运行期不变）。"""
+    template_path = os.path.join(_TEMPLATE_DIR, filename)
     try:
         with open(template_path, "r", encoding="utf-8") as handle:
             return handle.read()
@@ -296,8 +481,13 @@ def _load_template_text(filename: str) -> str:
         return ""
 
 
+_SMART_EDIT_PREFIX = "builtin.smart_edit"
+_SMART_EDIT_PREFIX_LEN = len(_SMART_EDIT_PREFIX)
+
+
 def _update_smart_edit_stats(command: str, status: str, result_msg: str = "") -> None:
-    if not command.strip().lower().startswith("builtin.smart_edit"):
+    # 只取前缀做小写比较，避免对整条命令做 strip/lower 拷贝
+    if command.lstrip()[:_SMART_EDIT_PREFIX_LEN].lower() != _SMART_EDIT_PREFIX:
         return
     _RUN_STATS["smart_edit_calls"] += 1
     if status == "rejected":
@@ -341,13 +531,22 @@ def _get_cli_approval_flow() -> CommandApprovalFlow:
     return _CLI_APPROVAL_FLOW
 
 
+_SHELL_RESULT_TAG_PATTERN = re.compile(
+    r"<(ps_call_result|bash_call_result)\b", re.IGNORECASE
+)
+
+
 def _contains_shell_result_tag(content: str) -> bool:
-    return bool(
-        re.search(r"<(ps_call_result|bash_call_result)\b", content, re.IGNORECASE)
-    )
+    # 不含 "<" 的内容不可能有标签，免去正则扫描；正则本身忽略大小写，无需复制小写文本
+    if "<" not in content:
+        return False
+    return _SHELL_RESULT_TAG_PATTERN.search(content) is not None
 
 
 def _extract_direct_shell_call(text: str) -> Optional[str]:
+    # 常见输入首字符既不是 ":" 也不是空白，直接判定，免去 lstrip
+    if not text or (text[0] != ":" and not text[0].isspace()):
+        return None
     stripped = text.lstrip()
     if not stripped.startswith(":"):
         return None
@@ -370,6 +569,79 @@ def _execute_direct_shell_call(command: str, console: Console, timeout: int) ->
     console.print(f"[info]{result_msg}[/info]\n")
 
 
+_COMPACT_REASON_MAP = {
+    "too_short": "历史过短，无需压缩",
+    "no_target": "没有可压缩的消息",
+    "empty": "无有效内容可压缩",
+    "compacting": "正在压缩中，请稍后再试",
+}
+
+
+def _print_session_list(console: Console, sessions: list) -> None:
+    """打印 /list 的会话列表：逐行生成文本，一次性输出。"""
+    console.print("\n[bold cyan]保存的会话：[/bold cyan]\n")
+    if not sessions:
+        console.print("[dim]  （暂无保存的会话）[/dim]\n")
+    rows: list[str] = []
+    for s in sessions:
+        row = (
+            f"  会话 {s['session_id']} | {s['created_at'][:19]} | "
+            f"消息数: {s['message_count']} | 深度: {s['depth']}"
+        )
+        msg_preview = s.get("first_message", "")
+        if msg_preview:
+            row += f" | [dim]{msg_preview}[/dim]"
+        rows.append(row)
+    if rows:
+        console.print(*rows, sep="\n")
+    console.print("")
+
+
+def _print_history_overview(console: Console, history: list) -> None:
+    """恢复会话时打印历史概览：逐条生成文本，最后一次性输出。"""
+    lines: list[str] = []
+    total = len(history)
+    for i, msg in enumerate(history):
+        role = msg.role
+        content = msg.content.strip()
+
+        if role == "system":
+            if content.startswith("你是一个任务执行agent") or content.startswith(
+                "会话ID:"
+            ):
+                continue
+
+        is_last = i == total - 1
+        index_tag = f"[dim]{i + 1}. [/dim]"
+
+        if role == "user":
+            if is_last:
+                lines.append(f"{index_tag}[user]用户:[/user]")
+                lines.append(f"{content}\n")
+            else:
+                preview = content[:100]
+                if len(preview) < len(content):
+                    preview += "..."
+                lines.append(f"{index_tag}[user]用户:[/user] {preview}")
+        elif role == "assistant":
+            if is_last:
+                lines.append(f"{index_tag}[assistant]助手:[/assistant]")
+                lines.append(f"{content}\n")
+            else:
+                preview = content[:50].replace("\n", " ")
+                lines.append(
+                    f"{index_tag}[assistant]助手:[/assistant] [dim]{preview}...[/dim]"
+                )
+        elif role == "tool":
+            lines.append(f"{index_tag}[info]工具: {content[:80]}...[/info]")
+        elif role == "system":
+            lines.append(f"{index_tag}[dim]系统: {content}[/dim]")
+
+    if lines:
+        # 多个对象一次 print：markup 仍逐条解析，输出与逐条 print 一致
+        console.print(*lines, sep="\n")
+
+
 def _handle_compact_command(
     executor: Executor, console: Console, reason: str = "手动压缩"
 ) -> None:
@@ -386,17 +658,11 @@ def _handle_compact_command(
         )
         return
 
-    reason_map = {
-        "too_short": "历史过短，无需压缩",
-        "no_target": "没有可压缩的消息",
-        "empty": "无有效内容可压缩",
-        "compacting": "正在压缩中，请稍后再试",
-    }
     reason_text = result.get("reason", "未知原因")
     if isinstance(reason_text, str) and reason_text.startswith("error:"):
         reason_text = f"压缩失败：{reason_text[6:].strip()}"
     else:
-        reason_text = reason_map.get(reason_text, reason_text)
+        reason_text = _COMPACT_REASON_MAP.get(reason_text, reason_text)
     console.print(f"[warning]{reason_text}[/warning]\n")
 
 
@@ -488,25 +754,34 @@ def check_llm_connection(config: Config) -> bool:
 
 def print_welcome():
     """打印欢迎信息"""
-    console.print(
-        Panel(
-            Text(
-                "极简任务执行 Agent\n\n统一逻辑：创建子Agent → 聚合结果 → 继续/结束\n深度优先执行，自动聚合结果\n最大4层深度（最多16个子Agent）\n默认对话模式（/chat 可切换），/exit 退出",
-                justify="center",
-                style="bold cyan",
-            ),
-            title="Simple Agent",
-            subtitle="按 Ctrl+C 中断",
-        )
+    console.print(_build_welcome_panel())
+
+
+@lru_cache(maxsize=1)
+def _build_welcome_panel() -> Panel:
+    """欢迎面板内容固定，首次构建后复用。"""
+    return Panel(
+        Text(
+            "极简任务执行 Agent\n\n统一逻辑：创建子Agent → 聚合结果 → 继续/结束\n深度优先执行，自动聚合结果\n最大4层深度（最多16个子Agent）\n默认对话模式（/chat 可切换），/exit 退出",
+            justify="center",
+            style="bold cyan",
+        ),
+        title="Simple Agent",
+        subtitle="按 Ctrl+C 中断",
     )
 
 
 def print_help():
     """打印帮助信息"""
-    console.print(
-        Panel(
-            Text(
-                """[bold cyan]命令列表[/bold cyan]
+    console.print(_build_help_panel())
+
+
+@lru_cache(maxsize=1)
+def _build_help_panel() -> Panel:
+    """帮助面板内容固定，首次构建后复用。"""
+    return Panel(
+        Text(
+            """[bold cyan]命令列表[/bold cyan]
 
 [bold yellow]交互模式：[/bold yellow]
   [bold]主循环[/bold] - 等待输入新任务
@@ -563,12 +838,11 @@ def print_help():
   - 主循环输入任务默认使用当前会话
   - 要创建新会话使用 /new 命令
   - 会话自动保存在 sessions/ 目录""",
-                justify="left",
-                style="white",
-            ),
-            title="Task-Agent Help",
-            subtitle="输入 /exit 退出",
-        )
+            justify="left",
+            style="white",
+        ),
+        title="Task-Agent Help",
+        subtitle="输入 /exit 退出",
     )
 
 
@@ -673,17 +947,20 @@ def main():
                 task = input("")
             else:
                 task = input("任务> ")
+            # 命令判断统一用一次小写结果
+            task_lower = task.lower()
 
             if paste_mode:
-                if task.lower() == "/send":
+                if task_lower == "/send":
                     if not paste_lines:
                         console.print("[warning]粘贴内容为空，已忽略[/warning]")
                         continue
                     paste_mode = False
                     task = "\n".join(paste_lines)
+                    task_lower = task.lower()
                     paste_lines = []
                     paste_prompt_shown = False
-                elif task.lower() == "/cancel":
+                elif task_lower == "/cancel":
                     paste_mode = False
                     paste_lines = []
                     paste_prompt_shown = False
@@ -692,13 +969,13 @@ def main():
                 else:
                     paste_lines.append(task)
                     continue
-            elif task.lower() == "/paste":
+            elif task_lower == "/paste":
                 paste_mode = True
                 paste_lines = []
                 paste_prompt_shown = False
                 console.print("[info]粘贴模式：/send 发送，/cancel 取消[/info]")
                 continue
-            elif task.lower() == "/edit":
+            elif task_lower == "/edit":
                 editor_text = _open_external_editor("")
                 if editor_text is None:
                     continue
@@ -706,45 +983,33 @@ def main():
                     console.print("[warning]编辑内容为空，已忽略[/warning]")
                     continue
                 task = editor_text
+                task_lower = task.lower()
 
             if not task.strip():
                 continue
 
-            if task.lower() == "/exit":
+            if task_lower == "/exit":
                 _print_run_stats(console)
                 _cleanup_background_jobs()
                 console.print("[info]再见！[/info]")
                 break
 
-            if task.lower() in ["help", "h"]:
+            if task_lower in ["help", "h"]:
                 print_help()
                 continue
 
             # 处理会话管理命令
             if task.startswith("/"):
-                if task.lower() == "/exit":
+                if task_lower == "/exit":
                     _print_run_stats(console)
                     _cleanup_background_jobs()
                     console.print("[info]再见！[/info]")
                     break
-                if task.lower() == "/list":
+                if task_lower == "/list":
                     sessions = session_manager.list_sessions()
-                    console.print("\n[bold cyan]保存的会话：[/bold cyan]\n")
-                    if not sessions:
-                        console.print("[dim]  （暂无保存的会话）[/dim]\n")
-                    for s in sessions:
-                        msg_preview = s.get("first_message", "")
-                        if msg_preview:
-                            console.print(
-                                f"  会话 {s['session_id']} | {s['created_at'][:19]} | 消息数: {s['message_count']} | 深度: {s['depth']} | [dim]{msg_preview}[/dim]"
-                            )
-                        else:
-                            console.print(
-                                f"  会话 {s['session_id']} | {s['created_at'][:19]} | 消息数: {s['message_count']} | 深度: {s['depth']}"
-                            )
-                    console.print("")
+                    _print_session_list(console, sessions)
                     continue
-                if task.lower().startswith("/list-snapshot"):
+                if task_lower.startswith("/list-snapshot"):
                     parts = task.split()
                     if len(parts) != 2:
                         console.print(
@@ -762,6 +1027,8 @@ def main():
                     if not snapshots:
                         console.print("[dim]  （暂无快照）[/dim]\n")
                         continue
+                    # 逐行生成后一次输出（markup 仍按行解析）
+                    rows = []
                     for s in snapshots:
                         preview = s.get("last_message", "")
                         if preview:
@@ -769,13 +1036,14 @@ def main():
                             preview = preview[:50] + (
                                 "..." if len(preview) > 50 else ""
                             )
-                        console.print(
+                        rows.append(
                             f"  会话 {s['session_id']} | 快照 {s['snapshot_index']} | {s['created_at'][:19]} | [dim]{preview}[/dim]"
                         )
-                    console.print("")
+                    rows.append("")
+                    console.print(*rows, sep="\n")
                     continue
 
-                if task.lower() == "/new":
+                if task_lower == "/new":
                     new_id, new_executor = session_manager.create_new_session(executor)
                     executor = new_executor
                     console.print(f"\n[success]新会话已创建: {new_id}[/success]\n")
@@ -804,55 +1072,13 @@ def main():
                                 console.print("[bold cyan]历史上下文：[/bold cyan]\n")
 
                                 history = executor.current_agent.history
-                                total = len(history)
-
-                                for i, msg in enumerate(history):
-                                    role = msg.role
-                                    content = msg.content.strip()
-
-                                    if role == "system":
-                                        if content.startswith(
-                                            "你是一个任务执行agent"
-                                        ) or content.startswith("会话ID:"):
-                                            continue
-
-                                    is_last = i == total - 1
-
-                                    if role == "user":
-                                        if is_last:
-                                            console.print(
-                                                f"[dim]{i + 1}. [/dim][user]用户:[/user]"
-                                            )
-                                            console.print(f"{content}\n")
-                                        else:
-                                            console.print(
-                                                f"[dim]{i + 1}. [/dim][user]用户:[/user] {content[:100]}{'...' if len(content) > 100 else ''}"
-                                            )
-                                    elif role == "assistant":
-                                        if is_last:
-                                            console.print(
-                                                f"[dim]{i + 1}. [/dim][assistant]助手:[/assistant]"
-                                            )
-                                            console.print(f"{content}\n")
-                                        else:
-                                            preview = content[:50].replace("\n", " ")
-                                            console.print(
-                                                f"[dim]{i + 1}. [/dim][assistant]助手:[/assistant] [dim]{preview}...[/dim]"
-                                            )
-                                    elif role == "tool":
-                                        console.print(
-                                            f"[dim]{i + 1}. [/dim][info]工具: {content[:80]}...[/info]"
-                                        )
-                                    elif role == "system":
-                                        console.print(
-                                            f"[dim]{i + 1}. [/dim][dim]系统: {content}[/dim]"
-                                        )
+                                _print_history_overview(console, history)
 
                                 console.print(
                                     "[dim]━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━[/dim]\n"
                                 )
                                 console.print(
-                                    f"[info]已加载 {total} 条历史消息[/info]\n"
+                                    f"[info]已加载 {len(history)} 条历史消息[/info]\n"
                                 )
                         else:
                             console.print("\n[error]恢复失败[/error]\n")
@@ -860,7 +1086,7 @@ def main():
                         console.print(f"\n[error]无效的会话ID: {parts[1]}[/error]\n")
                     continue
 
-                if task.lower() == "/chat":
+                if task_lower == "/chat":
                     if executor.chat_mode:
                         executor.leave_chat_mode()
                         console.print(
@@ -872,7 +1098,7 @@ def main():
                             "\n[success]已进入对话模式：跳过文件快照，命令强制手动授权[/success]\n"
                         )
                     continue
-                if task.lower() == "/auto":
+                if task_lower == "/auto":
                     if executor.chat_mode:
                         console.print(
                             "\n[warning]对话模式下不支持自动同意，请先 /chat 退出对话模式[/warning]\n"
@@ -882,11 +1108,11 @@ def main():
                     status = "启用" if executor.auto_approve else "禁用"
                     console.print(f"\n[success]自动同意已{status}[/success]\n")
                     continue
-                if task.lower() == "/compact":
+                if task_lower == "/compact":
                     _handle_compact_command(executor, console, reason="手动压缩")
                     continue
 
-                if task.lower().startswith("/rollback"):
+                if task_lower.startswith("/rollback"):
                     parts = task.split()
                     if len(parts) != 3:
                         console.print(
@@ -1024,12 +1250,12 @@ def _run_single_task(
     esc_listener = _start_esc_skip_listener(executor, console)
     try:
         for outputs, result in executor.run(task):
-            # 显示输出
-            for output in outputs:
-                console.print(output, end="", soft_wrap=True)
+            # 显示输出：一批片段合并为一次 print（markup 仍按片段各自解析）
+            if outputs:
+                console.print(*outputs, sep="", end="", soft_wrap=True)
 
-            # 检查是否需要等待用户输入
-            if any("[等待用户输入]" in output for output in outputs):
+            # 检查是否需要等待用户输入（看结构化动作，不扫描输出文本）
+            if result.action == Action.WAIT:
                 waiting_for_user_input = True
     finally:
         _stop_esc_skip_listener(esc_listener)
@@ -1059,9 +1285,10 @@ def _run_single_task(
         except KeyboardInterrupt:
             console.print("\n[warning]输入已取消[/warning]")
             break
+        line_lower = line.lower()
 
         if paste_mode:
-            if line.lower() == "/send":
+            if line_lower == "/send":
                 if not paste_lines:
                     console.print("[warning]粘贴内容为空，已忽略[/warning]")
                     continue
@@ -1069,7 +1296,7 @@ def _run_single_task(
                 user_input = "\n".join(paste_lines)
                 paste_lines = []
                 paste_prompt_shown = False
-            elif line.lower() == "/cancel":
+            elif line_lower == "/cancel":
                 paste_mode = False
                 paste_lines = []
                 paste_prompt_shown = False
@@ -1079,13 +1306,13 @@ def _run_single_task(
                 paste_lines.append(line)
                 continue
         else:
-            if line.lower() == "/paste":
+            if line_lower == "/paste":
                 paste_mode = True
                 paste_lines = []
                 paste_prompt_shown = False
                 console.print("[info]粘贴模式：/send 发送，/cancel 取消[/info]")
                 continue
-            if line.lower() == "/edit":
+            if line_lower == "/edit":
                 editor_text = _open_external_editor("")
                 if editor_text is None:
                     continue
@@ -1093,33 +1320,20 @@ def _run_single_task(
                     console.print("[warning]编辑内容为空，已忽略[/warning]")
                     continue
                 user_input = editor_text
-            elif line.lower() == "/exit":
+            elif line_lower == "/exit":
                 _print_run_stats(console)
                 console.print("[info]任务已终止[/info]")
                 waiting_for_user_input = False
                 break
             elif line.startswith("/"):
-                if line.lower() == "/list":
+                if line_lower == "/list":
                     if session_manager is None:
                         console.print("[warning]会话管理器未初始化[/warning]\n")
                         continue
                     sessions = session_manager.list_sessions()
-                    console.print("\n[bold cyan]保存的会话：[/bold cyan]\n")
-                    if not sessions:
-                        console.print("[dim]  （暂无保存的会话）[/dim]\n")
-                    for s in sessions:
-                        msg_preview = s.get("first_message", "")
-                        if msg_preview:
-                            console.print(
-                                f"  会话 {s['session_id']} | {s['created_at'][:19]} | 消息数: {s['message_count']} | 深度: {s['depth']} | [dim]{msg_preview}[/dim]"
-                            )
-                        else:
-                            console.print(
-                                f"  会话 {s['session_id']} | {s['created_at'][:19]} | 消息数: {s['message_count']} | 深度: {s['depth']}"
-                            )
-                    console.print("")
+                    _print_session_list(console, sessions)
                     continue
-                if line.lower() == "/compact":
+                if line_lower == "/compact":
                     _handle_compact_command(executor, console, reason="手动压缩")
                     continue
                 console.print(
@@ -1159,11 +1373,11 @@ def _run_single_task(
         try:
             for outputs, result in executor.resume(user_input):
                 # 显示输出（命令框已通过回调处理）
-                for output in outputs:
-                    console.print(output, end="", soft_wrap=True)
+                if outputs:
+                    console.print(*outputs, sep="", end="", soft_wrap=True)
 
-                # 检查是否需要等待用户输入
-                if any("[等待用户输入]" in output for output in outputs):
+                # 检查是否需要等待用户输入（看结构化动作，不扫描输出文本）
+                if result.action == Action.WAIT:
                     waiting_for_user_input = True
         finally:
             _stop_esc_skip_listener(esc_listener)
@@ -1265,6 +1479,10 @@ class _ExecResult:
 _BUILTIN_TOOL_PATTERN = re.compile(r"^\s*builtin\.(\w+)\s*(\{[\s\S]*\})?\s*$")
 
 
+# splitlines 会识别的、除 "\n" 以外的换行符
+_OTHER_LINE_BREAK_PATTERN = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
 def _prefix_builtin_result(tool_name: str, result: _ExecResult) -> _ExecResult:
     """为内置工具输出添加统一前缀，方便识别来源。"""
     prefix = f"{tool_name}: "
@@ -1274,6 +1492,9 @@ def _prefix_builtin_result(tool_name: str, result: _ExecResult) -> _ExecResult:
             return text
         if text.startswith(prefix):
             return text
+        if not _OTHER_LINE_BREAK_PATTERN.search(text):
+            # 只有 "\n" 换行时等价于逐行拆分再拼接：仅去掉一个结尾换行
+            return prefix + (text[:-1] if text.endswith("\n") else text)
         first_line, *rest = text.splitlines()
         first_line = prefix + first_line
         return "\n".join([first_line] + rest)
@@ -1317,6 +1538,9 @@ def _parse_builtin_kv_command(
     return {}, _format_builtin_parse_error(tool_name, error)
 
 
+_BUILTIN_NAME_PATTERN = re.compile(r"builtin\.(\w+)", re.IGNORECASE)
+
+
 def _execute_builtin_tool(
     command: str,
     config: Optional[Config] = None,
@@ -1324,63 +1548,29 @@ def _execute_builtin_tool(
     workspace_dir: str = "",
 ) -> Optional[_ExecResult]:
     stripped = command.strip()
-    if stripped.lower().startswith("builtin.smart_edit"):
-        parsed_args, error = _parse_smart_edit_command(stripped)
-        if error:
-            return _prefix_builtin_result("smart_edit", _ExecResult("", error, 1))
-        return _prefix_builtin_result(
-            "smart_edit", _execute_builtin_smart_edit(parsed_args, workspace_dir)
-        )
-    if stripped.lower().startswith("builtin.read_file"):
-        parsed_args, error = _parse_read_file_command(stripped)
-        if error:
-            return _prefix_builtin_result("read_file", _ExecResult("", error, 1))
-        return _prefix_builtin_result(
-            "read_file", _execute_builtin_read_file(parsed_args, workspace_dir)
-        )
-    if stripped.lower().startswith("builtin.get_job_log"):
-        parsed_args, error = _parse_job_log_command(stripped)
-        if error:
-            return _prefix_builtin_result("get_job_log", _ExecResult("", error, 1))
-        return _prefix_builtin_result(
-            "get_job_log", _execute_builtin_job_log(parsed_args)
-        )
-    if stripped.lower().startswith("builtin.get_resource"):
-        parsed_args, error = _parse_get_resource_command(stripped)
-        if error:
-            return _prefix_builtin_result("get_resource", _ExecResult("", error, 1))
-        return _prefix_builtin_result(
-            "get_resource", _execute_builtin_get_resource(parsed_args)
-        )
-    if stripped.lower().startswith("builtin.memory_query"):
-        parsed_args, error = _parse_memory_query_command(stripped)
-        if error:
-            return _prefix_builtin_result("memory_query", _ExecResult("", error, 1))
-        if not config:
-            return _prefix_builtin_result(
-                "memory_query", _ExecResult("", "memory_query 缺少配置", 1)
-            )
-        return _prefix_builtin_result(
-            "memory_query",
-            _execute_builtin_memory_query(parsed_args, config, context_messages or []),
-        )
-    if stripped.lower().startswith("builtin.create_schedule"):
-        parsed_args, error = _parse_create_schedule_command(stripped)
-        if error:
-            return _prefix_builtin_result("create_schedule", _ExecResult("", error, 1))
-        if not config:
-            return _prefix_builtin_result(
-                "create_schedule", _ExecResult("", "create_schedule 缺少配置", 1)
-            )
-        return _prefix_builtin_result(
-            "create_schedule",
-            _execute_builtin_create_schedule(parsed_args, config),
-        )
-    if stripped.lower().startswith("builtin.hint"):
-        parsed_args, error = _parse_hint_command(stripped)
+    # 一次匹配取出工具名，再查表分发（表定义见 _BUILTIN_TOOL_TABLE）
+    name_match = _BUILTIN_NAME_PATTERN.match(stripped)
+    if not name_match:
+        return None
+    tool_name = name_match.group(1).lower()
+    entry = _BUILTIN_TOOL_TABLE.get(tool_name)
+    if entry is None:
+        # 兼容旧的 startswith 语义：如 builtin.read_filex 仍按 read_file 处理
+        for name, candidate in _BUILTIN_TOOL_TABLE.items():
+            if tool_name.startswith(name):
+                tool_name, entry = name, candidate
+                break
+
+    if entry is not None:
+        parser, runner, needs_config, prefixed = entry
+        parsed_args, error = parser(stripped)
         if error:
-            return _ExecResult("", error, 1)
-        return _execute_builtin_hint(parsed_args)
+            result = _ExecResult("", error, 1)
+        elif needs_config and not config:
+            result = _ExecResult("", f"{tool_name} 缺少配置", 1)
+        else:
+            result = runner(parsed_args, config, context_messages or [], workspace_dir)
+        return _prefix_builtin_result(tool_name, result) if prefixed else result
 
     match = _BUILTIN_TOOL_PATTERN.match(command)
     if not match:
@@ -1392,15 +1582,32 @@ def _execute_builtin_tool(
     )
 
 
+# mtime 距今过近的文件不缓存：时间戳粒度内的同尺寸改写无法靠 (mtime, size) 区分
+_RACY_MTIME_NS = 2_000_000_000
+
+
+def _mtime_is_settled(mtime_ns: int) -> bool:
+    """mtime 超出竞态窗口后，(路径, mtime, size) 才能可靠地作为缓存键。"""
+    return time.time_ns() - mtime_ns >= _RACY_MTIME_NS
+
+
+# (路径, mtime, size, 编码) -> 整个文件的行；小文件分段读取时直接切片，文件改动后自动失效
+_FILE_LINES_CACHE: dict[tuple[str, int, int, str], tuple[str, ...]] = {}
+_FILE_LINES_CACHE_MAX = 32
+_FILE_LINES_CACHE_MAX_BYTES = 512 * 1024
+
+
 def _read_text_file(path: str, start_line: int, max_lines: int, encoding: str):
-    if not os.path.exists(path):
-        return None, None, None, None, None, f"文件不存在: {path}"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, 0, None, None, None, None, f"文件不存在: {path}"
 
-    if os.path.isdir(path):
-        return None, None, None, None, None, f"路径是目录而非文件: {path}"
+    if stat.S_ISDIR(st.st_mode):
+        return None, 0, None, None, None, None, f"路径是目录而非文件: {path}"
 
     if start_line < 1 or max_lines < 1:
-        return None, None, None, None, None, "start_line 和 max_lines 必须大于等于 1"
+        return None, 0, None, None, None, None, "start_line 和 max_lines 必须大于等于 1"
 
     max_lines_cap = 2000
     capped = False
@@ -1408,26 +1615,36 @@ def _read_text_file(path: str, start_line: int, max_lines: int, encoding: str):
         max_lines = max_lines_cap
         capped = True
 
-    lines = []
-    has_more = False
+    stop = start_line - 1 + max_lines
+    cache_key = (path, st.st_mtime_ns, st.st_size, encoding)
+    cacheable = st.st_size <= _FILE_LINES_CACHE_MAX_BYTES and _mtime_is_settled(
+        st.st_mtime_ns
+    )
+    cached = _FILE_LINES_CACHE.get(cache_key) if cacheable else None
     try:
-        with open(path, "r", encoding=encoding, errors="replace") as handle:
-            for index, line in enumerate(handle, start=1):
-                if index < start_line:
-                    continue
-                if len(lines) >= max_lines:
-                    has_more = True
-                    break
-                lines.append(line)
+        if cached is None and cacheable:
+            with open(path, "r", encoding=encoding, errors="replace") as handle:
+                cached = tuple(handle)
+            if len(_FILE_LINES_CACHE) >= _FILE_LINES_CACHE_MAX:
+                _FILE_LINES_CACHE.pop(next(iter(_FILE_LINES_CACHE)))
+            _FILE_LINES_CACHE[cache_key] = cached
+        if cached is not None:
+            lines = list(cached[start_line - 1 : stop])
+            has_more = len(cached) > stop
+        else:
+            with open(path, "r", encoding=encoding, errors="replace") as handle:
+                # islice 在 C 层跳过前缀行，再探测一行判断是否还有剩余
+                lines = list(islice(handle, start_line - 1, stop))
+                has_more = len(lines) == max_lines and next(handle, None) is not None
     except Exception as exc:
-        return None, None, None, None, None, f"读取文件失败: {exc}"
+        return None, 0, None, None, None, None, f"读取文件失败: {exc}"
 
     returned = len(lines)
     if returned:
         end_line = start_line + returned - 1
     else:
         end_line = start_line - 1
-    return lines, has_more, capped, end_line, max_lines, None
+    return "".join(lines), returned, has_more, capped, end_line, max_lines, None
 
 
 def _resolve_builtin_file_path(
@@ -1458,13 +1675,12 @@ def _execute_builtin_read_file(args: dict, workspace_dir: str = "") -> _ExecResu
         return _ExecResult("", "start_line 和 max_lines 必须是整数", 1)
 
     encoding = args.get("encoding") or "utf-8-sig"
-    lines, has_more, capped, end_line, max_lines, error = _read_text_file(
+    content, returned, has_more, capped, end_line, max_lines, error = _read_text_file(
         abs_path, start_line, max_lines, encoding
     )
     if error:
         return _ExecResult("", error, 1)
 
-    returned = len(lines) if lines is not None else 0
     header_lines = [
         "内置工具 builtin.read_file 执行成功。",
         f"路径: {abs_path}",
@@ -1483,7 +1699,6 @@ def _execute_builtin_read_file(args: dict, workspace_dir: str = "") -> _ExecResu
     else:
         header_lines.append("已到文件末尾。")
 
-    content = "".join(lines) if lines is not None else ""
     if not content:
         content = "(空内容)"
 
@@ -1504,13 +1719,12 @@ def _execute_builtin_job_log(args: dict) -> _ExecResult:
 
     log_path = _get_ps_jobs_dir() / f"job_{job_id}.log"
     encoding = args.get("encoding") or "utf-8-sig"
-    lines, has_more, capped, end_line, max_lines, error = _read_text_file(
+    content, returned, has_more, capped, end_line, max_lines, error = _read_text_file(
         str(log_path), start_line, max_lines, encoding
     )
     if error:
         return _ExecResult("", error, 1)
 
-    returned = len(lines) if lines is not None else 0
     header_lines = [
         "内置工具 builtin.get_job_log 执行成功。",
         f"job_id: {job_id}",
@@ -1530,7 +1744,6 @@ def _execute_builtin_job_log(args: dict) -> _ExecResult:
     else:
         header_lines.append("已到文件末尾。")
 
-    content = "".join(lines) if lines is not None else ""
     if not content:
         content = "(空内容)"
 
@@ -1548,21 +1761,47 @@ def _parse_hint_command(command: str) -> tuple[dict, Optional[str]]:
     return args, None
 
 
+# hints 目录位置在进程内不变，导入时解析一次
+_HINTS_ROOT = Path(__file__).resolve().parents[2] / "hints"
+
+
 def _get_hints_root() -> Path:
-    project_root = Path(__file__).resolve().parents[2]
-    return project_root / "hints"
+    return _HINTS_ROOT
+
+
+# (hint 名, modules 目录 mtime) -> 模块列表；目录增删文件会改变 mtime，自动失效
+_HINT_MODULE_CACHE: dict[tuple[str, int], list[Path]] = {}
+_HINT_MODULE_CACHE_MAX = 32
 
 
 def _collect_hint_modules(name: str) -> list[Path]:
     hints_root = _get_hints_root()
     modules_dir = hints_root / name / "modules"
-    if not modules_dir.exists() or not modules_dir.is_dir():
+    try:
+        st = modules_dir.stat()
+    except OSError:
+        return []
+    if not stat.S_ISDIR(st.st_mode):
         return []
+    key = (name, st.st_mtime_ns)
+    cached = _HINT_MODULE_CACHE.get(key)
+    if cached is not None:
+        return list(cached)
     if is_windows():
         modules = list(modules_dir.glob("*.psm1")) + list(modules_dir.glob("*.ps1"))
     else:
         modules = list(modules_dir.glob("*.sh"))
-    return sorted(modules)
+    modules = sorted(modules)
+    if len(_HINT_MODULE_CACHE) >= _HINT_MODULE_CACHE_MAX:
+        # 按插入顺序淘汰最早的条目
+        _HINT_MODULE_CACHE.pop(next(iter(_HINT_MODULE_CACHE)))
+    _HINT_MODULE_CACHE[key] = modules
+    return list(modules)
+
+
+# (提示词路径, mtime, size) -> 去除首尾空白后的内容；文件改动后自动失效
+_HINT_TEXT_CACHE: dict[tuple[str, int, int], str] = {}
+_HINT_TEXT_CACHE_MAX = 16
 
 
 def _execute_builtin_hint(args: dict) -> _ExecResult:
@@ -1579,12 +1818,24 @@ def _execute_builtin_hint(args: dict) -> _ExecResult:
         hints_root = _get_hints_root()
         hint_dir = hints_root / str(name)
         prompt_path = select_hint_file(hint_dir, ".md")
-        if not prompt_path or not prompt_path.exists():
+        if not prompt_path:
             return _ExecResult("", "hint 提示词不存在", 1)
         try:
-            content = prompt_path.read_text(encoding="utf-8").strip()
-        except Exception as exc:
-            return _ExecResult("", "读取 hint 提示词失败", 1)
+            st = prompt_path.stat()
+        except OSError:
+            return _ExecResult("", "hint 提示词不存在", 1)
+        cache_key = (str(prompt_path), st.st_mtime_ns, st.st_size)
+        cacheable = _mtime_is_settled(st.st_mtime_ns)
+        content = _HINT_TEXT_CACHE.get(cache_key) if cacheable else None
+        if content is None:
+            try:
+                content = prompt_path.read_text(encoding="utf-8").strip()
+            except Exception as exc:
+                return _ExecResult("", "读取 hint 提示词失败", 1)
+            if cacheable:
+                if len(_HINT_TEXT_CACHE) >= _HINT_TEXT_CACHE_MAX:
+                    _HINT_TEXT_CACHE.pop(next(iter(_HINT_TEXT_CACHE)))
+                _HINT_TEXT_CACHE[cache_key] = content
         if not content:
             return _ExecResult("", "hint 提示词为空", 1)
         _ACTIVE_HINT = str(name)
@@ -1597,15 +1848,24 @@ def _execute_builtin_hint(args: dict) -> _ExecResult:
     return _ExecResult("", f"未知 hint action: {action}", 1)
 
 
+def _strip_quotes(value: str) -> str:
+    """去掉成对的首尾引号。"""
+    if len(value) >= 2 and value[0] in ('"', "'") and value[-1] == value[0]:
+        return value[1:-1]
+    return value
+
+
 def _parse_smart_edit_command(command: str) -> tuple[dict, Optional[str]]:
     lines = command.splitlines()
     if not lines:
         return {}, "smart_edit 命令为空"
 
-    if not lines[0].strip().lower().startswith("builtin.smart_edit"):
+    if lines[0].lstrip()[:_SMART_EDIT_PREFIX_LEN].lower() != _SMART_EDIT_PREFIX:
         return {}, "smart_edit 命令格式错误"
 
     args: dict[str, str] = {}
+    # 扫描时顺带收集 path/file/filepath/mode，省去再跑一遍通用 key:value 解析
+    flat_args: dict[str, str] = {}
     index = 1
     while index < len(lines):
         line = lines[index]
@@ -1614,23 +1874,12 @@ def _parse_smart_edit_command(command: str) -> tuple[dict, Optional[str]]:
             continue
 
         lower = line.lower()
-        if (
-            lower.startswith("path:")
-            or lower.startswith("file:")
-            or lower.startswith("filepath:")
-        ):
-            value = line.split(":", 1)[1].strip()
-            if len(value) >= 2 and value[0] == value[-1] and value[0] in {'"', "'"}:
-                value = value[1:-1]
-            if not value:
+        key = lower.split(":", 1)[0]
+        if key in ("path", "file", "filepath", "mode") and ":" in lower:
+            value = _strip_quotes(line.split(":", 1)[1].strip())
+            if key != "mode" and not value:
                 return {}, "path 不能为空"
-            args["path"] = value
-            index += 1
-            continue
-        if lower.startswith("mode:"):
-            value = line.split(":", 1)[1].strip()
-            if value:
-                args["mode"] = value
+            flat_args[key] = value
             index += 1
             continue
         if lower.startswith("old_text:") or lower.startswith("new_text:"):
@@ -1651,7 +1900,8 @@ def _parse_smart_edit_command(command: str) -> tuple[dict, Optional[str]]:
 
         return {}, f"无法解析 smart_edit 行: {line}"
 
-    raw_args = parse_builtin_simple_kv_args(command)
+    # 单行内联 JSON 形式没有 key:value 行，仍交给通用解析
+    raw_args = flat_args if len(lines) > 1 else parse_builtin_simple_kv_args(command)
     base_raw = {}
     for key in ("path", "file", "filepath", "mode"):
         if key in raw_args and str(raw_args.get(key, "")).strip():
@@ -1671,15 +1921,20 @@ def _parse_get_resource_command(command: str) -> tuple[dict, Optional[str]]:
     return _parse_builtin_kv_command(command, "get_resource")
 
 
+_WIN_DRIVE_PATTERN = re.compile(r"^[a-zA-Z]:")
+
+
 def _is_safe_relative_path(path: str) -> bool:
     if not path:
         return False
     if os.path.isabs(path):
         return False
-    if re.match(r"^[a-zA-Z]:", path):
+    if _WIN_DRIVE_PATTERN.match(path):
         return False
-    parts = Path(path).parts
-    return ".." not in parts
+    if ".." not in path:
+        return True
+    # 两种分隔符都按段检查，不依赖平台的 Path 解析
+    return ".." not in path.replace("\\", "/").split("/")
 
 
 def _resolve_resource_path(
@@ -1792,10 +2047,14 @@ def _parse_time_to_epoch(raw: str, tz_name: str) -> tuple[Optional[int], Optiona
     return None, f"无法解析时间: {value}"
 
 
-def _load_snapshot_json(path: str) -> Optional[dict]:
+def _parse_snapshot_json(raw: bytes) -> Optional[dict]:
+    try:
+        return json_loads(raw)
+    except Exception:
+        pass
+    # 非法 UTF-8 或 orjson 不接受的内容（如 NaN）按原方式宽松解析
     try:
-        with open(path, "r", encoding="utf-8", errors="replace") as handle:
-            return json.load(handle)
+        return json.loads(raw.decode("utf-8", errors="replace"))
     except Exception:
         return None
 
@@ -1831,28 +2090,76 @@ def _iter_snapshot_sequences(snapshot_data: dict) -> list[list[dict]]:
     return sequences
 
 
-def _score_content(content: str, terms: list[str]) -> int:
-    text = content.lower()
+# (快照路径, mtime, size) -> 提取出的消息序列；快照重写后自动失效
+_SNAPSHOT_SEQUENCES_CACHE: dict[tuple[str, int, int], list[list[dict]]] = {}
+_SNAPSHOT_SEQUENCES_CACHE_MAX = 256
+
+
+_SNAPSHOT_LOAD_WORKERS = 8
+
+
+def _extract_snapshot_sequences(path: str) -> list[list[dict]]:
+    try:
+        with open(path, "rb") as handle:
+            raw = handle.read()
+    except Exception:
+        return []
+    # 没有 history 键的快照不会产出消息序列，跳过整份 JSON 解析
+    if b'"history"' not in raw:
+        return []
+    snapshot = _parse_snapshot_json(raw)
+    return _iter_snapshot_sequences(snapshot) if snapshot else []
+
+
+def _load_snapshot_sequences(
+    cache_keys: list[tuple[str, int, int]],
+) -> list[list[list[dict]]]:
+    """按顺序返回每个快照的消息序列；未命中缓存的快照用线程池并发读取。"""
+    # 回滚/裁剪会原地重写快照，mtime 仍在竞态窗口内的快照既不读缓存也不写缓存
+    found = {
+        key: _SNAPSHOT_SEQUENCES_CACHE.get(key) if _mtime_is_settled(key[1]) else None
+        for key in cache_keys
+    }
+    missing = [key for key, sequences in found.items() if sequences is None]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(_SNAPSHOT_LOAD_WORKERS, len(missing))
+        ) as pool:
+            loaded = list(pool.map(_extract_snapshot_sequences, [k[0] for k in missing]))
+    else:
+        loaded = [_extract_snapshot_sequences(k[0]) for k in missing]
+    # 缓存只在调用线程写入
+    for key, sequences in zip(missing, loaded):
+        found[key] = sequences
+        if not _mtime_is_settled(key[1]):
+            continue
+        if len(_SNAPSHOT_SEQUENCES_CACHE) >= _SNAPSHOT_SEQUENCES_CACHE_MAX:
+            _SNAPSHOT_SEQUENCES_CACHE.pop(next(iter(_SNAPSHOT_SEQUENCES_CACHE)))
+        _SNAPSHOT_SEQUENCES_CACHE[key] = sequences
+    return [found[key] for key in cache_keys]
+
+
+def _score_content(content_lower: str, terms: list[str]) -> int:
     score = 0
     for term in terms:
-        score += text.count(term)
+        score += content_lower.count(term)
     return score
 
 
 def _build_window_text(seq: list[dict], start: int, end: int, max_chars: int) -> str:
     lines = []
-    total = 0
+    # 剩余字符预算（不计换行），超出时截断当前行并结束
+    budget = max_chars
     for msg in seq[start:end]:
-        role = msg.get("role", "")
-        role_label = "用户" if role == "user" else "助手"
-        line = f"{role_label}: {msg.get('content', '')}"
-        if total + len(line) > max_chars:
-            remaining = max_chars - total
-            if remaining > 0:
-                lines.append(line[:remaining] + "...")
+        role_label = "用户: " if msg.get("role", "") == "user" else "助手: "
+        line = role_label + msg.get("content", "")
+        line_len = len(line)
+        if line_len > budget:
+            if budget > 0:
+                lines.append(line[:budget] + "...")
             break
         lines.append(line)
-        total += len(line)
+        budget -= line_len
     return "\n".join(lines)
 
 
@@ -1873,17 +2180,51 @@ def _extract_context_tail(context_messages: list, count: int) -> str:
     return "\n".join(kept)
 
 
+def _find_json_array(text: str) -> Optional[list]:
+    """单次线性扫描找出第一个可解析的 JSON 数组。
+
+    用栈记录未闭合的 "[" 位置（数组内跳过字符串内容），每当括号回到深度 0
+    就尝试解析该片段；候选片段互不重叠，总耗时与文本长度成线性关系。
+    """
+    start = text.find("[")
+    if start == -1:
+        return None
+    stack: list[int] = []
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == "[":
+            stack.append(index)
+        elif not stack:
+            # 数组之外的引号和 "]" 不参与匹配
+            continue
+        elif ch == '"':
+            in_string = True
+        elif ch == "]":
+            open_index = stack.pop()
+            if not stack:
+                try:
+                    return json_loads(text[open_index : index + 1])
+                except json.JSONDecodeError:
+                    pass
+    return None
+
+
 def _parse_json_array(text: str) -> Optional[list]:
+    # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
     try:
-        return json.loads(text)
+        return json_loads(text)
     except json.JSONDecodeError:
-        match = re.search(r"\[[\s\S]*\]", text)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError:
-                return None
-    return None
+        return _find_json_array(text)
 
 
 def _llm_expand_query_terms(client, query: str) -> list[str]:
@@ -1904,6 +2245,9 @@ def _llm_expand_query_terms(client, query: str) -> list[str]:
     return terms
 
 
+_MEMORY_FILTER_WORKERS = 4
+
+
 def _llm_filter_windows(
     client, query: str, windows: list[dict], batch_size: int
 ) -> dict[int, dict]:
@@ -1911,16 +2255,34 @@ def _llm_filter_windows(
     template = _load_template_text("memory_filter_prompt.txt")
     if not template:
         template = "用户问题：{query}\n\n候选片段：\n{items}"
+    batches = []
+    prompts = []
     for start in range(0, len(windows), batch_size):
         batch = windows[start : start + batch_size]
         items = []
         for item in batch:
             items.append(f"[{item['index']}]\n{item['text']}")
-        prompt = template.format(
-            query=query,
-            items="\n\n".join(items),
+        batches.append(batch)
+        prompts.append(
+            template.format(
+                query=query,
+                items="\n\n".join(items),
+            )
         )
-        response = client.chat([ChatMessage(role="user", content=prompt)], 2048)
+
+    def chat(prompt: str):
+        return client.chat([ChatMessage(role="user", content=prompt)], 2048)
+
+    # 各批次互相独立，并发请求；结果仍按批次顺序处理，异常在取结果时抛出
+    if len(prompts) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(_MEMORY_FILTER_WORKERS, len(prompts))
+        ) as pool:
+            responses = list(pool.map(chat, prompts))
+    else:
+        responses = [chat(prompt) for prompt in prompts]
+
+    for batch, response in zip(batches, responses):
         parsed = _parse_json_array(response.content or "")
         if not parsed:
             for item in batch:
@@ -2012,64 +2374,61 @@ def _execute_builtin_memory_query(
 
     candidates = {}
     max_chars_per_window = 1500
-    files = sorted(
-        f
-        for f in os.listdir(sessions_dir)
-        if f.endswith(".json") and os.path.isfile(os.path.join(sessions_dir, f))
+    with os.scandir(sessions_dir) as it:
+        entries = sorted(
+            (e for e in it if e.name.endswith(".json") and e.is_file()),
+            key=lambda e: e.name,
+        )
+
+    # 忽略大小写匹配原文，缓存里不必再保存一份小写副本
+    term_pattern = re.compile(
+        "|".join(re.escape(term) for term in terms), re.IGNORECASE
     )
 
-    source_index = 0
-    for filename in files:
-        snapshot = _load_snapshot_json(os.path.join(sessions_dir, filename))
-        if not snapshot:
+    # 单次遍历快照：打分的同时保留序列，窗口文本直接从这里构建
+    cache_keys: list[tuple[str, int, int]] = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
             continue
-        sequences = _iter_snapshot_sequences(snapshot)
+        cache_keys.append((entry.path, st.st_mtime_ns, st.st_size))
+
+    seq_lookup: list[list[dict]] = []
+    for sequences in _load_snapshot_sequences(cache_keys):
         for seq in sequences:
             seq_len = len(seq)
             if seq_len == 0:
                 continue
+            source_index = len(seq_lookup)
+            seq_lookup.append(seq)
             for i, msg in enumerate(seq):
-                score = _score_content(msg.get("content", ""), terms)
-                if score <= 0:
+                content = msg["content"]
+                # 大多数消息不含任何关键词，先用一次正则扫描排除，命中后才转小写打分
+                if not term_pattern.search(content):
+                    continue
+                score = _score_content(content.lower(), terms)
+                if not score:
                     continue
                 half = window // 2
                 start = max(i - half, 0)
                 end = min(i + half + 1, seq_len)
                 key = (source_index, start, end)
-                if key in candidates:
-                    candidates[key] = max(candidates[key], score)
-                else:
-                    candidates[key] = score
-            source_index += 1
+                # 命中时 score 至少为 1，缺省值 0 不会影响取最大值
+                candidates[key] = max(candidates.get(key, 0), score)
 
     if not candidates:
         return _ExecResult("memory_query: 未命中", "", 0)
 
-    candidate_items = []
-    for (source_id, start, end), score in candidates.items():
-        seq = None
-        # source_id tracks incremental sequences in traversal order
-        # we only need to rebuild the window text by re-reading snapshots
-        candidate_items.append((source_id, start, end, score))
-
+    candidate_items = [
+        (source_id, start, end, score)
+        for (source_id, start, end), score in candidates.items()
+    ]
     candidate_items.sort(key=lambda x: x[3], reverse=True)
     candidate_items = candidate_items[:candidate]
 
     windows = []
-    seq_lookup: list[list[dict]] = []
-    source_index = 0
-    for filename in files:
-        snapshot = _load_snapshot_json(os.path.join(sessions_dir, filename))
-        if not snapshot:
-            continue
-        sequences = _iter_snapshot_sequences(snapshot)
-        for seq in sequences:
-            seq_lookup.append(seq)
-            source_index += 1
-
     for idx, (source_id, start, end, score) in enumerate(candidate_items, start=1):
-        if source_id >= len(seq_lookup):
-            continue
         seq = seq_lookup[source_id]
         text = _build_window_text(seq, start, end, max_chars_per_window)
         windows.append({"index": idx, "text": text, "score": score})
@@ -2236,21 +2595,18 @@ def _execute_builtin_smart_edit(args: dict, workspace_dir: str = "") -> _ExecRes
     if not os.path.exists(abs_path):
         return _ExecResult("", "文件不存在", 1)
 
-    has_bom = False
     try:
         with open(abs_path, "rb") as handle:
-            head = handle.read(3)
-        if head == b"\xef\xbb\xbf":
-            has_bom = True
-    except Exception:
-        pass
-
-    try:
-        with open(abs_path, "r", encoding="utf-8-sig", errors="replace") as handle:
-            content = handle.read()
+            raw = handle.read()
     except Exception as exc:
         return _ExecResult("", f"读取失败: {exc}", 1)
 
+    has_bom = raw.startswith(b"\xef\xbb\xbf")
+    # 与文本模式读取保持一致：去掉 BOM 并做通用换行转换
+    content = raw.decode("utf-8-sig", errors="replace")
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+
     target_line_ending = "\r\n" if "\r\n" in content else "\n"
     norm_content = content.replace("\r\n", "\n")
     norm_new = new_text.replace("\r\n", "\n")
@@ -2267,18 +2623,22 @@ def _execute_builtin_smart_edit(args: dict, workspace_dir: str = "") -> _ExecRes
         if not old_text.strip():
             return _ExecResult("", "Patch 模式需要 old_text。", 1)
         norm_old = old_text.replace("\r\n", "\n")
-        match_count = len(re.findall(re.escape(norm_old), norm_content))
+        # 字面量计数：与 re.findall(re.escape(...)) 一样按不重叠匹配统计
+        match_count = norm_content.count(norm_old)
         if match_count == 0:
             return _ExecResult("", "匹配失败：未找到 old_text。", 1)
         if match_count > 1:
             return _ExecResult("", f"安全错误：匹配到 {match_count} 处。", 1)
-        final_norm_content = norm_content.replace(norm_old, norm_new)
+        final_norm_content = norm_content.replace(norm_old, norm_new, 1)
         if final_norm_content == norm_content:
             return _ExecResult("", "严重错误：替换未生效。", 1)
 
     output_content = final_norm_content
     if target_line_ending == "\r\n":
-        output_content = final_norm_content.replace("\r\n", "\n").replace("\n", "\r\n")
+        # 内容已统一为 LF；只有 "\r\r\n" 之类的边界情况才会残留 CRLF，需要先折叠
+        if "\r\n" in output_content:
+            output_content = output_content.replace("\r\n", "\n")
+        output_content = output_content.replace("\n", "\r\n")
 
     try:
         encoding = "utf-8-sig" if has_bom else "utf-8"
@@ -2290,6 +2650,116 @@ def _execute_builtin_smart_edit(args: dict, workspace_dir: str = "") -> _ExecRes
     return _ExecResult(f"成功 ({mode})", "", 0)
 
 
+def _run_builtin_smart_edit(args, config, context_messages, workspace_dir):
+    return _execute_builtin_smart_edit(args, workspace_dir)
+
+
+def _run_builtin_read_file(args, config, context_messages, workspace_dir):
+    return _execute_builtin_read_file(args, workspace_dir)
+
+
+def _run_builtin_job_log(args, config, context_messages, workspace_dir):
+    return _execute_builtin_job_log(args)
+
+
+def _run_builtin_get_resource(args, config, context_messages, workspace_dir):
+    return _execute_builtin_get_resource(args)
+
+
+def _run_builtin_memory_query(args, config, context_messages, workspace_dir):
+    return _execute_builtin_memory_query(args, config, context_messages)
+
+
+def _run_builtin_create_schedule(args, config, context_messages, workspace_dir):
+    return _execute_builtin_create_schedule(args, config)
+
+
+def _run_builtin_hint(args, config, context_messages, workspace_dir):
+    return _execute_builtin_hint(args)
+
+
+# 工具名 -> (解析函数, 执行函数, 是否需要 config, 是否添加输出前缀)
+# 插入顺序与旧版 startswith 判断顺序一致，前缀回退匹配依赖该顺序
+_BUILTIN_TOOL_TABLE = {
+    "smart_edit": (_parse_smart_edit_command, _run_builtin_smart_edit, False, True),
+    "read_file": (_parse_read_file_command, _run_builtin_read_file, False, True),
+    "get_job_log": (_parse_job_log_command, _run_builtin_job_log, False, True),
+    "get_resource": (
+        _parse_get_resource_command,
+        _run_builtin_get_resource,
+        False,
+        True,
+    ),
+    "memory_query": (
+        _parse_memory_query_command,
+        _run_builtin_memory_query,
+        True,
+        True,
+    ),
+    "create_schedule": (
+        _parse_create_schedule_command,
+        _run_builtin_create_schedule,
+        True,
+        True,
+    ),
+    "hint": (_parse_hint_command, _run_builtin_hint, False, False),
+}
+
+
+# 设置 PowerShell 输出编码为 UTF-8，避免中文乱码
+# Windows 中文系统默认输出是 GBK (CP936)，需要显式设置
+_PS_UTF8_PRELUDE = (
+    "[Console]::OutputEncoding = [System.Text.Encoding]::UTF8; "
+    '$PSDefaultParameterValues["Out-File:Encoding"] = "utf8"; '
+)
+_PS_BACKGROUND_PRELUDE = (
+    _PS_UTF8_PRELUDE + '$ProgressPreference = "SilentlyContinue"; '
+    '$InformationPreference = "SilentlyContinue"; '
+    '$VerbosePreference = "SilentlyContinue"; '
+    '$WarningPreference = "SilentlyContinue"; '
+)
+
+
+# hint 模块只在 load/unload 时变化，按模块列表缓存导入前缀
+@lru_cache(maxsize=8)
+def _build_ps_import_prefix(modules: tuple[Path, ...]) -> str:
+    if not modules:
+        return ""
+    start_dir = _ps_escape(_AGENT_START_DIR)
+    project_dir = _ps_escape(str(_HINTS_ROOT.parent))
+    env_prefix = (
+        f"$env:AGENT_START_DIR='{start_dir}'; "
+        f"$env:AGENT_PROJECT_DIR='{project_dir}'; "
+    )
+    parts = []
+    for module_path in modules:
+        resolved_path = module_path.resolve()
+        path_text = _ps_escape(str(resolved_path))
+        module_dir = _ps_escape(str(resolved_path.parent))
+        parts.append(
+            f"$env:HINT_MODULE_DIR='{module_dir}'; Import-Module '{path_text}'"
+        )
+    return env_prefix + "; ".join(parts) + "; "
+
+
+@lru_cache(maxsize=8)
+def _build_bash_import_prefix(modules: tuple[Path, ...]) -> str:
+    if not modules:
+        return ""
+    start_dir = shlex.quote(_AGENT_START_DIR)
+    project_dir = shlex.quote(str(_HINTS_ROOT.parent))
+    parts = [
+        f"export AGENT_START_DIR={start_dir};",
+        f"export AGENT_PROJECT_DIR={project_dir};",
+    ]
+    for module_path in modules:
+        resolved_path = module_path.resolve()
+        module_dir = resolved_path.parent
+        parts.append(f"export HINT_MODULE_DIR={shlex.quote(str(module_dir))};")
+        parts.append(f"source {shlex.quote(str(resolved_path))};")
+    return " ".join(parts) + " "
+
+
 def _execute_command(
     command: str,
     timeout: int,
@@ -2308,65 +2778,23 @@ def _execute_command(
     Returns:
         Result 对象，包含 stdout, stderr, returncode
     """
-    import base64
-    import shlex
-    import subprocess
-
     builtin_result = _execute_builtin_tool(
         command, config, context_messages, workspace_dir=workspace_dir
     )
     if builtin_result is not None:
         return builtin_result
 
-    def build_import_prefix() -> str:
-        if not _ACTIVE_HINT_MODULES:
-            return ""
-        project_root = Path(__file__).resolve().parents[2]
-        start_dir = _ps_escape(_AGENT_START_DIR)
-        project_dir = _ps_escape(str(project_root))
-        env_prefix = (
-            f"$env:AGENT_START_DIR='{start_dir}'; "
-            f"$env:AGENT_PROJECT_DIR='{project_dir}'; "
-        )
-        parts = []
-        for module_path in _ACTIVE_HINT_MODULES:
-            resolved_path = module_path.resolve()
-            path_text = _ps_escape(str(resolved_path))
-            module_dir = _ps_escape(str(resolved_path.parent))
-            parts.append(
-                f"$env:HINT_MODULE_DIR='{module_dir}'; Import-Module '{path_text}'"
-            )
-        if not parts:
-            return ""
-        return env_prefix + "; ".join(parts) + "; "
-
     if is_windows():
-        import_prefix = build_import_prefix()
-
-        # 设置 PowerShell 输出编码为 UTF-8，避免中文乱码
-        # Windows 中文系统默认输出是 GBK (CP936)，需要显式设置
-        if background:
-            prefixed_command = (
-                "[Console]::OutputEncoding = [System.Text.Encoding]::UTF8; "
-                '$PSDefaultParameterValues["Out-File:Encoding"] = "utf8"; '
-                '$ProgressPreference = "SilentlyContinue"; '
-                '$InformationPreference = "SilentlyContinue"; '
-                '$VerbosePreference = "SilentlyContinue"; '
-                '$WarningPreference = "SilentlyContinue"; '
-                f"{import_prefix}{command}"
-            )
-        else:
-            prefixed_command = (
-                "[Console]::OutputEncoding = [System.Text.Encoding]::UTF8; "
-                '$PSDefaultParameterValues["Out-File:Encoding"] = "utf8"; '
-                f"{import_prefix}{command}"
-            )
+        import_prefix = _build_ps_import_prefix(tuple(_ACTIVE_HINT_MODULES))
+        prelude = _PS_BACKGROUND_PRELUDE if background else _PS_UTF8_PRELUDE
+        prefixed_command = f"{prelude}{import_prefix}{command}"
 
         # 使用 UTF-16 LE 编码并 Base64 编码命令，避免引号转义问题
         encoded_command = base64.b64encode(prefixed_command.encode("utf-16-le")).decode(
             "ascii"
         )
-        full_cmd = f"powershell -EncodedCommand {encoded_command}"
+        # 直接启动 powershell，不经过 cmd.exe 中转（Base64 参数无需 shell 解析）
+        full_cmd = ["powershell", "-EncodedCommand", encoded_command]
 
         try:
             if background:
@@ -2375,7 +2803,7 @@ def _execute_command(
                 log_path = jobs_dir / f"job_{job_id}.log"
                 log_handle = open(log_path, "ab")
                 process = subprocess.Popen(
-                    full_cmd, shell=True, stdout=log_handle, stderr=log_handle
+                    full_cmd, stdout=log_handle, stderr=log_handle
                 )
                 log_handle.close()
                 _register_background_job(job_id, process, log_path)
@@ -2387,9 +2815,7 @@ def _execute_command(
                 result_msg = f"后台执行已启动\njob_id: {job_id}\nlog_path: {rel_log}"
                 return _ExecResult(stdout=result_msg, stderr="", returncode=0)
 
-            process = subprocess.run(
-                full_cmd, shell=True, capture_output=True, timeout=timeout
-            )
+            process = subprocess.run(full_cmd, capture_output=True, timeout=timeout)
         except (subprocess.SubprocessError, OSError, FileNotFoundError) as e:
             # 捕获命令执行异常（如命令行太长、文件未找到等）
             # 创建一个错误结果对象
@@ -2400,24 +2826,7 @@ def _execute_command(
         stderr = process.stderr.decode("utf-8", errors="replace")
         return _ExecResult(stdout, stderr, process.returncode)
 
-    def build_bash_prefix() -> str:
-        if not _ACTIVE_HINT_MODULES:
-            return ""
-        project_root = Path(__file__).resolve().parents[2]
-        start_dir = shlex.quote(_AGENT_START_DIR)
-        project_dir = shlex.quote(str(project_root))
-        parts = [
-            f"export AGENT_START_DIR={start_dir};",
-            f"export AGENT_PROJECT_DIR={project_dir};",
-        ]
-        for module_path in _ACTIVE_HINT_MODULES:
-            resolved_path = module_path.resolve()
-            module_dir = resolved_path.parent
-            parts.append(f"export HINT_MODULE_DIR={shlex.quote(str(module_dir))};")
-            parts.append(f"source {shlex.quote(str(resolved_path))};")
-        return " ".join(parts) + " "
-
-    import_prefix = build_bash_prefix()
+    import_prefix = _build_bash_import_prefix(tuple(_ACTIVE_HINT_MODULES))
     prefixed_command = f"{import_prefix}{command}"
 
     try:
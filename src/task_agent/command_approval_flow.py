@@ -44,10 +44,17 @@ class CommandApprovalFlow:
     ) -> tuple[list[CommandSpec], list[CommandSpec]]:
         auto_list: list[CommandSpec] = []
         manual_list: list[CommandSpec] = []
+        # 同一批次内工作目录不变，相同命令只判定一次
+        decisions: dict[tuple[str, str], bool] = {}
         for command_spec in commands:
-            if can_auto_execute_command(
-                command_spec, auto_approve, workspace_dir, config=config
-            ):
+            key = (command_spec.command, str(getattr(command_spec, "tool", "")))
+            allowed = decisions.get(key)
+            if allowed is None:
+                allowed = can_auto_execute_command(
+                    command_spec, auto_approve, workspace_dir, config=config
+                )
+                decisions[key] = allowed
+            if allowed:
                 auto_list.append(command_spec)
             else:
                 manual_list.append(command_spec)
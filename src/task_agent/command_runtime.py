@@ -47,8 +47,11 @@ def normalize_command_spec(command: object) -> CommandSpec:
 
 def is_builtin_command(command_spec: CommandSpec) -> bool:
     tool = str(getattr(command_spec, "tool", "")).strip().lower()
-    command = (command_spec.command or "").strip().lower()
-    return tool == "builtin" or command.startswith("builtin.")
+    if tool == "builtin":
+        return True
+    # 只转换开头的工具名部分，避免对整段 smart_edit 内容做 lower()
+    head = (command_spec.command or "").lstrip()[:8]
+    return head.lower() == "builtin."
 
 
 def is_shell_tool(command_spec: CommandSpec) -> bool:
@@ -104,8 +107,12 @@ def can_auto_execute_command(
     )
 
 
+# 平台在进程内不变，结果标签只需确定一次
+_SHELL_RESULT_TAG = get_shell_result_tag()
+
+
 def format_shell_result(status: str, message: str) -> str:
-    tag = get_shell_result_tag()
+    tag = _SHELL_RESULT_TAG
     return f'<{tag} id="{status}">\n{message}\n</{tag}>'
 
 
@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_ROOT = PROJECT_ROOT / "src"
+sys.path.insert(0, str(SRC_ROOT))
+
+import task_agent.cli as cli
+
+
+def test_parse_json_array_extracts_array_from_surrounding_text():
+    text = '结果如下：\n[{"index": 1, "reason": "含有 ] 和 [ 的说明"}]\n以上。'
+    assert cli._parse_json_array(text) == [
+        {"index": 1, "reason": "含有 ] 和 [ 的说明"}
+    ]
+
+
+def test_parse_json_array_skips_non_json_brackets():
+    text = '[注意] 输出：["alpha", "beta"] 完成 [end]'
+    assert cli._parse_json_array(text) == ["alpha", "beta"]
+    assert cli._parse_json_array("没有数组 [") is None
+
+
+def test_parse_json_array_handles_unbalanced_and_nested_input():
+    for size in (2, 10, 100, 1000):
+        assert cli._parse_json_array("x [" * size) is None
+        assert cli._parse_json_array("[" * size + "]") is None
+        # 未闭合的前缀会吞掉后面的数组
+        assert cli._parse_json_array("[" * size + '["ok"]') is None
+        # 多余的 "]" 不影响后面的数组
+        assert cli._parse_json_array("] " * size + '["ok"]') == ["ok"]
+        # 先闭合的非 JSON 片段被跳过
+        assert cli._parse_json_array("[x] " * size + '["ok"]') == ["ok"]
+    for depth in (1, 10, 100):
+        nested = "[" * depth + "1" + "]" * depth
+        expected = 1
+        for _ in range(depth):
+            expected = [expected]
+        assert cli._parse_json_array("结果：" + nested + " 完成") == expected
+
+
+def _write_snapshot(path, content, mtime_ns):
+    data = {"current_agent": {"history": [{"role": "user", "content": content}]}}
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    st = path.stat()
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+def test_snapshot_cache_sees_same_size_rewrite_with_same_mtime(tmp_path):
+    snapshot = tmp_path / "demo.0.json"
+    mtime_ns = time.time_ns()
+    first_key = _write_snapshot(snapshot, "alpha", mtime_ns)
+    [first] = cli._load_snapshot_sequences([first_key])
+    assert first[0][0]["content"] == "alpha"
+
+    # 回滚后原地重写：尺寸和 mtime 都不变
+    second_key = _write_snapshot(snapshot, "gamma", mtime_ns)
+    assert second_key == first_key
+    [second] = cli._load_snapshot_sequences([second_key])
+    assert second[0][0]["content"] == "gamma"
@@ -1,4 +1,6 @@
+import os
 import sys
+import time
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -48,3 +50,67 @@ def test_smart_edit_relative_path_fails_without_workspace():
     )
     assert result.returncode == 1
     assert "workspace_dir 未设置" in result.stderr
+
+
+def test_resolve_path_uses_pre_resolved_workspace(tmp_path):
+    from task_agent.builtin_schema import resolve_path_against_workspace
+
+    resolved, error = resolve_path_against_workspace(
+        "demo.txt", "", workspace_path=tmp_path.resolve()
+    )
+    assert error is None
+    assert resolved == (tmp_path / "demo.txt").resolve()
+
+
+def _read_second_line(workspace):
+    return cli._execute_builtin_read_file(
+        {"path": "demo.txt", "start_line": "2", "max_lines": "1"},
+        workspace_dir=str(workspace),
+    ).stdout
+
+
+def _cached_paths():
+    return {key[0] for key in cli._FILE_LINES_CACHE}
+
+
+def test_read_file_cache_hits_and_invalidates_on_change(tmp_path):
+    target = tmp_path / "demo.txt"
+    # 回拨 mtime 使其超出竞态窗口，首次读取即写入缓存
+    old_ns = time.time_ns() - 60_000_000_000
+    target.write_text("a\nb\nc\n", encoding="utf-8")
+    os.utime(target, ns=(old_ns, old_ns))
+    first = _read_second_line(tmp_path)
+    assert first.endswith("---\nb\n")
+    assert "start_line=3" in first
+    assert str(target.resolve()) in _cached_paths()
+
+    # 尺寸和 mtime 都不变时命中缓存，返回的仍是缓存内容
+    target.write_text("a\nx\nc\n", encoding="utf-8")
+    os.utime(target, ns=(old_ns, old_ns))
+    assert _read_second_line(tmp_path).endswith("---\nb\n")
+
+    # mtime 变化使缓存失效
+    os.utime(target, ns=(old_ns + 1_000_000_000, old_ns + 1_000_000_000))
+    assert _read_second_line(tmp_path).endswith("---\nx\n")
+
+    # 尺寸变化使缓存失效
+    target.write_text("a\nchanged\n", encoding="utf-8")
+    os.utime(target, ns=(old_ns + 1_000_000_000, old_ns + 1_000_000_000))
+    second = _read_second_line(tmp_path)
+    assert second.endswith("---\nchanged\n")
+    assert "已到文件末尾" in second
+
+
+def test_read_file_cache_sees_same_size_rewrite_with_same_mtime(tmp_path):
+    target = tmp_path / "demo.txt"
+    mtime_ns = time.time_ns()
+    target.write_text("a\nb\nc\n", encoding="utf-8")
+    os.utime(target, ns=(mtime_ns, mtime_ns))
+    assert _read_second_line(tmp_path).endswith("---\nb\n")
+    # mtime 仍在竞态窗口内，不写入缓存
+    assert str(target.resolve()) not in _cached_paths()
+
+    # 同尺寸改写且 mtime 不变（模拟粗粒度时间戳）
+    target.write_text("a\nx\nc\n", encoding="utf-8")
+    os.utime(target, ns=(mtime_ns, mtime_ns))
+    assert _read_second_line(tmp_path).endswith("---\nx\n")
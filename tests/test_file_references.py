@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_ROOT = PROJECT_ROOT / "src"
+sys.path.insert(0, str(SRC_ROOT))
+
+import task_agent.cli as cli
+
+
+def test_oversized_file_reference_is_truncated(tmp_path):
+    target = tmp_path / "big.txt"
+    # 多字节字符跨越 1 MiB 边界，截断后不应产生解码错误
+    prefix = b"a" * (cli._MAX_FILE_REF_BYTES - 1)
+    target.write_bytes(prefix + "中".encode("utf-8") + b"tail")
+
+    content, error = cli._read_file_reference(str(target))
+
+    assert content is not None
+    assert content.startswith("a" * 16)
+    assert "中" not in content and "tail" not in content
+    assert content.endswith("已截断]")
+    assert error is not None and "已截断" in error
+
+
+def test_file_reference_within_limit_normalizes_newlines(tmp_path):
+    target = tmp_path / "small.txt"
+    target.write_bytes(b"line1\r\nline2\rline3")
+
+    content, error = cli._read_file_reference(str(target))
+
+    assert content == "line1\nline2\nline3"
+    assert error is None